@@ -0,0 +1,419 @@
+import argparse
+import os
+import pickle
+import re
+import time
+from urllib.parse import urlsplit
+
+# Bump whenever the compiled layout changes so stale caches are rebuilt
+ENGINE_VERSION = 2
+
+# Used when no filter list has been configured or found on disk
+DEFAULT_RULES = [
+    "||doubleclick.net^",
+    "||googlesyndication.com^",
+    "||googleadservices.com^",
+    "||adservice.google.com^",
+    "||google-analytics.com^",
+    "||googletagservices.com^",
+    "||amazon-adsystem.com^",
+    "||adnxs.com^",
+    "||taboola.com^",
+    "||outbrain.com^",
+    "||criteo.com^",
+    "||scorecardresearch.com^",
+    "||moatads.com^",
+    "||pubmatic.com^",
+    "||rubiconproject.com^",
+    "||openx.net^",
+]
+
+# Resource type names used in filter options
+RESOURCE_TYPES = [
+    "document", "subdocument", "stylesheet", "script", "image", "font", "object",
+    "media", "xmlhttprequest", "ping", "websocket", "other",
+]
+_TYPE_BITS = {name: 1 << i for i, name in enumerate(RESOURCE_TYPES)}
+_TYPE_BITS["xhr"] = _TYPE_BITS["xmlhttprequest"]
+_TYPE_BITS["frame"] = _TYPE_BITS["subdocument"]
+_ALL_TYPES = (1 << len(RESOURCE_TYPES)) - 1
+# Filters without an explicit type never block the top-level page itself
+_DEFAULT_TYPES = _ALL_TYPES & ~_TYPE_BITS["document"]
+
+# Options that only change how a rule is matched, not whether it applies
+_IGNORED_OPTIONS = {"match-case", "important"}
+# Party options and whether each one means third-party
+_PARTY_OPTIONS = {"third-party": True, "3p": True, "first-party": False, "1p": False}
+
+_TOKEN = re.compile(r"[a-z0-9%]+")
+_PATTERN_TOKEN = re.compile(r"[a-z0-9%]{3,}")
+_SEPARATOR = r"(?:[^\w.%-]|$)"
+
+
+def _parent_domains(host):
+    # "a.b.example.com" -> a.b.example.com, b.example.com, example.com, com
+    while host:
+        yield host
+        dot = host.find(".")
+        if dot < 0:
+            return
+        host = host[dot + 1:]
+
+
+def _base_domain(host):
+    # Good enough for third-party checks without a public suffix list
+    parts = host.rsplit(".", 2)
+    return ".".join(parts[-2:])
+
+
+def _domain_matches(host, domains):
+    return any(parent in domains for parent in _parent_domains(host))
+
+
+class NetworkRule:
+    __slots__ = ("source", "exception", "third_party", "types",
+                 "include_domains", "exclude_domains", "_regex")
+
+    def __init__(self, source, exception, third_party, types, include_domains, exclude_domains):
+        self.source = source
+        self.exception = exception
+        self.third_party = third_party
+        self.types = types
+        self.include_domains = include_domains
+        self.exclude_domains = exclude_domains
+        self._regex = None
+
+    def __getstate__(self):
+        # Regexes are compiled lazily after loading from the cache
+        return (self.source, self.exception, self.third_party, self.types,
+                self.include_domains, self.exclude_domains)
+
+    def __setstate__(self, state):
+        (self.source, self.exception, self.third_party, self.types,
+         self.include_domains, self.exclude_domains) = state
+        self._regex = None
+
+    def matches(self, url, first_party_host, third_party, type_bit):
+        if not self.types & type_bit:
+            return False
+        if self.third_party is not None and self.third_party != third_party:
+            return False
+        if self.include_domains and not _domain_matches(first_party_host, self.include_domains):
+            return False
+        if self.exclude_domains and _domain_matches(first_party_host, self.exclude_domains):
+            return False
+        if self.source is None:
+            return True
+        if self._regex is None:
+            self._regex = re.compile(self.source)
+        return self._regex.search(url) is not None
+
+
+def _pattern_to_regex(pattern):
+    if len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/"):
+        return pattern[1:-1]
+    prefix = ""
+    suffix = ""
+    if pattern.startswith("||"):
+        prefix = r"^[a-z][a-z0-9+.-]*://(?:[^/?#]*\.)?"
+        pattern = pattern[2:]
+    elif pattern.startswith("|"):
+        prefix = "^"
+        pattern = pattern[1:]
+    if pattern.endswith("|"):
+        suffix = "$"
+        pattern = pattern[:-1]
+    body = []
+    for char in pattern:
+        if char == "*":
+            body.append(".*")
+        elif char == "^":
+            body.append(_SEPARATOR)
+        else:
+            body.append(re.escape(char))
+    return prefix + "".join(body) + suffix
+
+
+def _pattern_tokens(pattern):
+    # Tokens guaranteed to appear as whole tokens in any URL the pattern
+    # matches; any of them can key the rule's bucket
+    if pattern.startswith("/") and pattern.endswith("/"):
+        return []
+    tokens = []
+    for match in _PATTERN_TOKEN.finditer(pattern):
+        start, end = match.span()
+        if start == 0 or pattern[start - 1] == "*":
+            continue
+        if end == len(pattern) or pattern[end] == "*":
+            continue
+        tokens.append(match.group())
+    return tokens
+
+
+class FilterEngine:
+    """Compiled EasyList/Adblock Plus network filters.
+
+    Plain "||domain^" rules go into a host set that is probed with the
+    request's parent domains; everything else is bucketed under whichever of
+    its literal tokens the fewest rules have, so a request only tests the
+    few rules that share one of its URL tokens.
+    """
+
+    def __init__(self):
+        self.blocked_hosts = set()
+        self.allowed_hosts = set()
+        self.block_rules = {}
+        self.allow_rules = {}
+        self.untokenized_block = []
+        self.untokenized_allow = []
+        self.generic_selectors = []
+        self.domain_selectors = {}
+        self.selector_exceptions = {}
+        self.rule_count = 0
+
+    # --- parsing ---
+
+    def add_rules(self, lines):
+        # Network rules are bucketed once all lines are read, when it is
+        # known how many rules share each token
+        parsed = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(("!", "[")):
+                continue
+            if "##" in line or "#@#" in line:
+                self._add_cosmetic(line)
+            elif "#?#" in line or "#$#" in line or "#%#" in line:
+                continue
+            else:
+                rule = self._add_network(line)
+                if rule is not None:
+                    parsed.append(rule)
+        self._bucket(parsed)
+
+    def _bucket(self, parsed):
+        frequency = {}
+        for rule, tokens in parsed:
+            for token in set(tokens):
+                frequency[token] = frequency.get(token, 0) + 1
+        for rule, tokens in parsed:
+            buckets = self.allow_rules if rule.exception else self.block_rules
+            if not tokens:
+                (self.untokenized_allow if rule.exception else self.untokenized_block).append(rule)
+                continue
+            # Rules already bucketed by an earlier list count too; longer
+            # tokens win ties as they are rarer in URLs
+            token = min(tokens, key=lambda t: (frequency[t] + len(buckets.get(t, ())), -len(t)))
+            buckets.setdefault(token, []).append(rule)
+
+    def _add_cosmetic(self, line):
+        exception = "#@#" in line
+        domains, selector = line.split("#@#" if exception else "##", 1)
+        domains = [d.strip() for d in domains.split(",") if d.strip()]
+        excluded = [d[1:] for d in domains if d.startswith("~")]
+        domains = [d for d in domains if not d.startswith("~")]
+        if exception:
+            for domain in domains:
+                self.selector_exceptions.setdefault(domain, set()).add(selector)
+            return
+        # "~example.com##sel" hides sel everywhere but example.com, the same
+        # as pairing it with "example.com#@#sel"
+        for domain in excluded:
+            self.selector_exceptions.setdefault(domain, set()).add(selector)
+        if domains:
+            for domain in domains:
+                self.domain_selectors.setdefault(domain, []).append(selector)
+        else:
+            self.generic_selectors.append(selector)
+
+    def _add_network(self, line):
+        exception = line.startswith("@@")
+        if exception:
+            line = line[2:]
+        pattern, options = line, ""
+        if "$" in line and not (line.startswith("/") and line.endswith("/")):
+            pattern, options = line.rsplit("$", 1)
+
+        third_party = None
+        types = 0
+        excluded_types = 0
+        include_domains = set()
+        exclude_domains = set()
+        for option in filter(None, options.lower().split(",")):
+            negated = option.startswith("~")
+            name = option.lstrip("~")
+            if name in _PARTY_OPTIONS:
+                third_party = _PARTY_OPTIONS[name] != negated
+            elif name.startswith("domain="):
+                for domain in name[len("domain="):].split("|"):
+                    if domain.startswith("~"):
+                        exclude_domains.add(domain[1:])
+                    elif domain:
+                        include_domains.add(domain)
+            elif name in _TYPE_BITS:
+                if negated:
+                    excluded_types |= _TYPE_BITS[name]
+                else:
+                    types |= _TYPE_BITS[name]
+            elif name in _IGNORED_OPTIONS:
+                continue
+            else:
+                # csp=, redirect=, popup and friends can't be expressed by
+                # blocking a request, so the whole rule is skipped
+                return None
+        if not types:
+            types = _DEFAULT_TYPES
+        types &= ~excluded_types
+
+        pattern = pattern.lower()
+        plain_host = (pattern.startswith("||") and pattern.endswith("^")
+                      and re.fullmatch(r"[a-z0-9.-]+", pattern[2:-1]) is not None)
+        self.rule_count += 1
+        if plain_host and not options:
+            (self.allowed_hosts if exception else self.blocked_hosts).add(pattern[2:-1])
+            return None
+
+        source = _pattern_to_regex(pattern) if pattern.strip("*") else None
+        rule = NetworkRule(source, exception, third_party, types,
+                           frozenset(include_domains), frozenset(exclude_domains))
+        # Bucketed by add_rules
+        return rule, _pattern_tokens(pattern)
+
+    # --- matching ---
+
+    def _any_rule(self, buckets, untokenized, tokens, url, first_party_host, third_party, type_bit):
+        for token in tokens:
+            for rule in buckets.get(token, ()):
+                if rule.matches(url, first_party_host, third_party, type_bit):
+                    return True
+        for rule in untokenized:
+            if rule.matches(url, first_party_host, third_party, type_bit):
+                return True
+        return False
+
+    def should_block(self, url, first_party_url="", resource_type="other"):
+        url = url.lower()
+        if not url.startswith(("http:", "https:", "ws:", "wss:")):
+            return False
+        host = urlsplit(url).hostname or ""
+        first_party_host = (urlsplit(first_party_url.lower()).hostname or "") if first_party_url else ""
+        third_party = bool(first_party_host) and _base_domain(host) != _base_domain(first_party_host)
+        type_bit = _TYPE_BITS.get(resource_type, _TYPE_BITS["other"])
+        tokens = None
+
+        blocked = type_bit & _DEFAULT_TYPES and _domain_matches(host, self.blocked_hosts)
+        if not blocked:
+            tokens = set(_TOKEN.findall(url))
+            blocked = self._any_rule(self.block_rules, self.untokenized_block, tokens,
+                                     url, first_party_host, third_party, type_bit)
+        if not blocked:
+            return False
+
+        if _domain_matches(host, self.allowed_hosts):
+            return False
+        if tokens is None:
+            tokens = set(_TOKEN.findall(url))
+        return not self._any_rule(self.allow_rules, self.untokenized_allow, tokens,
+                                  url, first_party_host, third_party, type_bit)
+
+    def cosmetic_selectors(self, host, generic=None):
+        # Element-hiding selectors that apply on the given page host; generic
+        # replaces the generic selectors the result starts from
+        selectors = list(self.generic_selectors if generic is None else generic)
+        exceptions = set()
+        for domain in _parent_domains(host):
+            selectors.extend(self.domain_selectors.get(domain, ()))
+            exceptions.update(self.selector_exceptions.get(domain, ()))
+        if exceptions:
+            selectors = [s for s in selectors if s not in exceptions]
+        return selectors
+
+
+def _signature(paths):
+    signature = [ENGINE_VERSION]
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def load_engine(paths, cache_path=None):
+    # Compile the given filter lists, reusing the on-disk cache when none of
+    # the lists changed since it was written
+    paths = [p for p in paths if os.path.exists(p)]
+    signature = _signature(paths)
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_signature, engine = pickle.load(f)
+            if cached_signature == signature:
+                return engine
+        except (pickle.UnpicklingError, EOFError, AttributeError, ValueError, IOError):
+            pass
+
+    engine = FilterEngine()
+    if not paths:
+        engine.add_rules(DEFAULT_RULES)
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            engine.add_rules(f)
+
+    if cache_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            with open(cache_path + ".tmp", 'wb') as f:
+                pickle.dump((signature, engine), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + ".tmp", cache_path)
+        except IOError:
+            pass
+    return engine
+
+
+def read_recorded_requests(path):
+    # One request per line: url <TAB> first-party url <TAB> resource type
+    requests = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0]:
+                fields += [""] * (3 - len(fields))
+                requests.append((fields[0], fields[1], fields[2] or "other"))
+    return requests
+
+
+def benchmark(engine, requests, rounds=5):
+    # Replays the requests through the matcher; returns per-request timings in microseconds
+    timings = []
+    blocked = 0
+    for _ in range(rounds):
+        blocked = 0
+        for url, first_party, resource_type in requests:
+            start = time.perf_counter()
+            if engine.should_block(url, first_party, resource_type):
+                blocked += 1
+            timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "requests": len(requests),
+        "blocked": blocked,
+        "mean_us": sum(timings) / len(timings) if timings else 0.0,
+        "p50_us": timings[len(timings) // 2] if timings else 0.0,
+        "p99_us": timings[int(len(timings) * 0.99)] if timings else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded request URLs through the ad-block matcher")
+    parser.add_argument("lists", nargs="*", help="EasyList/ABP filter lists (built-in rules if omitted)")
+    parser.add_argument("--urls", required=True, help="recorded requests, as written by the browser's recorder")
+    parser.add_argument("--cache", help="compiled cache file to use")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = load_engine(args.lists, args.cache)
+    load_ms = (time.perf_counter() - start) * 1000
+    result = benchmark(engine, read_recorded_requests(args.urls), args.rounds)
+    print(f"Loaded {engine.rule_count} rules in {load_ms:.1f} ms")
+    print(f"{result['requests']} requests, {result['blocked']} blocked")
+    print(f"mean {result['mean_us']:.2f} us, p50 {result['p50_us']:.2f} us, p99 {result['p99_us']:.2f} us")
@@ -0,0 +1,277 @@
+import itertools
+import json
+import os
+import re
+import time
+from collections import deque
+from PyQt5.QtCore import QObject, QTimer, QUrl, QSize, Qt, pyqtSignal
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineProfile, QWebEngineDownloadItem
+from io_service import IOService, encode_image
+from page_capture import FullPageCapture, IMAGE_FORMATS
+
+FORMATS = {"html": "html", "mhtml": "mhtml", "png": "png", "jpg": "jpg", "webp": "webp"}
+WORKERS = 4
+TIMEOUT_S = 30
+RETRIES = 1
+VIEWPORT = QSize(1280, 800)
+# Time given to late layout and paint after loadFinished before a PNG grab
+SETTLE_MS = 500
+
+
+def read_url_file(path):
+    # One URL per line; blank lines and lines starting with # are skipped
+    urls = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                urls.append(line)
+    return urls
+
+
+def output_name(index, url, fmt):
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", re.sub(r"^https?://", "", url)).strip("_")[:80]
+    return f"{index:05d}_{slug or 'page'}.{fmt}"
+
+
+def _encode_grab(image, fmt, scale, quality):
+    # On the I/O pool: scaling and encoding are the slow part of a viewport capture
+    if scale != 1.0:
+        image = image.scaledToWidth(max(1, round(image.width() * scale)), Qt.SmoothTransformation)
+    return encode_image(image, fmt, quality)
+
+
+class CaptureJob:
+    __slots__ = ("index", "url", "attempt", "started", "load_ms", "error", "report")
+
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.attempt = 0
+        self.started = None
+        self.load_ms = None
+        self.error = None
+        self.report = None
+
+
+class CaptureWorker(QObject):
+    """One page of the pool: loads a job, writes its output, asks for the next."""
+
+    def __init__(self, scheduler, profile):
+        super().__init__(scheduler)
+        self.scheduler = scheduler
+        self.profile = profile
+        self.view = QWebEngineView()
+        self.view.setPage(QWebEnginePage(profile, self.view))
+        self.view.resize(VIEWPORT)
+        # Pages only paint, and so only grab, while their view is shown
+        self.view.setAttribute(Qt.WA_DontShowOnScreen)
+        self.view.show()
+        self.view.loadFinished.connect(self.on_load_finished)
+        self.job = None
+        self.capture = None
+        self._token = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.on_timeout)
+
+    def next(self):
+        self.job = self.scheduler.take()
+        if self.job is None:
+            self.scheduler.worker_idle(self)
+            return
+        self._token += 1
+        self.job.attempt += 1
+        self.job.started = time.perf_counter()
+        self.job.load_ms = None
+        self._timer.start(int(self.scheduler.timeout * 1000))
+        self.view.load(QUrl.fromUserInput(self.job.url))
+
+    def _current(self, token):
+        return self.job is not None and token == self._token
+
+    def on_load_finished(self, ok):
+        if self.job is None or self.job.load_ms is not None:
+            return
+        self.job.load_ms = (time.perf_counter() - self.job.started) * 1000
+        if not ok:
+            self.fail("load failed")
+            return
+        token = self._token
+        path = os.path.join(self.scheduler.output_dir, output_name(self.job.index, self.job.url, self.scheduler.fmt))
+        save_started = time.perf_counter()
+        if self.scheduler.fmt == "html":
+            self.view.page().toHtml(lambda html: self._write_html(token, path, html, save_started))
+        elif self.scheduler.fmt == "mhtml":
+            self.scheduler.expect_download(path, lambda ok: self._saved(token, path, save_started, ok))
+            self.view.page().save(path, QWebEngineDownloadItem.MimeHtmlSaveFormat)
+        else:
+            QTimer.singleShot(SETTLE_MS, lambda: self._write_image(token, path, save_started))
+
+    def _write_html(self, token, path, html, save_started):
+        if not self._current(token):
+            return
+        self.scheduler.write(path, lambda: html.encode('utf-8'),
+                             lambda error: self._saved(token, path, save_started, error is None, error))
+
+    def _write_image(self, token, path, save_started):
+        if not self._current(token):
+            return
+        scheduler = self.scheduler
+        if not scheduler.full_page:
+            image = self.view.grab().toImage()
+            fmt = IMAGE_FORMATS[scheduler.fmt]
+            scheduler.write(path, lambda: _encode_grab(image, fmt, scheduler.scale, scheduler.quality),
+                            lambda error: self._saved(token, path, save_started, error is None, error))
+            return
+        capture = self.capture = FullPageCapture(self.view, path, scheduler.fmt, scheduler.scale,
+                                                 scheduler.quality, parent=self)
+        capture.finished.connect(lambda ok, report: self._captured(token, capture, path, save_started, ok, report))
+        capture.start()
+
+    def _captured(self, token, capture, path, save_started, ok, report):
+        capture.deleteLater()
+        if capture is self.capture:
+            self.capture = None
+        if self._current(token):
+            self.job.report = {key: report.get(key) for key in
+                               ("width", "height", "tiles", "truncated", "settle_ms", "grab_ms", "encode_ms")}
+        self._saved(token, path, save_started, ok)
+
+    def _saved(self, token, path, save_started, ok, error=None):
+        if not self._current(token):
+            return
+        if not ok:
+            self.fail(f"write failed: {error}" if error else "write failed")
+            return
+        self._timer.stop()
+        job, self.job = self.job, None
+        self.scheduler.record(job, "ok", path, (time.perf_counter() - save_started) * 1000)
+        self.next()
+
+    def on_timeout(self):
+        # Callbacks still pending for this job are ignored from here on
+        self._token += 1
+        if self.capture is not None:
+            self.capture.cancel()
+        # A fresh page guarantees no late signal from the abandoned load
+        # is mistaken for the next job's
+        old_page = self.view.page()
+        self.view.setPage(QWebEnginePage(self.profile, self.view))
+        old_page.deleteLater()
+        self.fail("timeout")
+
+    def fail(self, reason):
+        self._timer.stop()
+        job, self.job = self.job, None
+        job.error = reason
+        if job.attempt <= self.scheduler.retries:
+            self.scheduler.retry(job)
+        else:
+            self.scheduler.record(job, "timeout" if reason == "timeout" else "error", None, None)
+        self.next()
+
+
+class BatchCapture(QObject):
+    """Captures a list of URLs with a pool of concurrent offscreen pages.
+
+    Every URL gets one line in the JSONL manifest with its outcome, attempt
+    count and timings; finished is emitted with the number of failures once
+    the queue is drained.
+    """
+
+    finished = pyqtSignal(int)
+
+    def __init__(self, urls, output_dir, fmt="html", workers=WORKERS, timeout=TIMEOUT_S,
+                 retries=RETRIES, manifest=None, full_page=False, scale=1.0, quality=-1, parent=None):
+        super().__init__(parent)
+        self.output_dir = output_dir
+        self.fmt = FORMATS[fmt]
+        # Image formats only
+        self.full_page = full_page
+        self.scale = scale
+        self.quality = quality
+        self.timeout = timeout
+        self.retries = retries
+        os.makedirs(output_dir, exist_ok=True)
+        self.manifest = open(manifest or os.path.join(output_dir, "manifest.jsonl"), 'a', encoding='utf-8')
+        self._queue = deque(CaptureJob(i, url) for i, url in enumerate(urls))
+        self.failures = 0
+        self._downloads = {}
+        # HTML and viewport images are written atomically on a thread pool,
+        # so pages never wait on each other's disk writes
+        self.io = IOService(max(1, workers), self)
+        self.io.saved.connect(lambda tag, path: self._written(tag, None))
+        self.io.failed.connect(lambda tag, path, message: self._written(tag, message))
+        self._writes = {}  # tag -> callback(error)
+        self._write_ids = itertools.count()
+
+        # Off-the-record so archiving never touches the browsing profile
+        self.profile = QWebEngineProfile(self)
+        self.profile.downloadRequested.connect(self.on_download)
+        self.workers = [CaptureWorker(self, self.profile) for _ in range(max(1, min(workers, len(self._queue))))]
+        self._busy = set(self.workers)
+
+    def start(self):
+        if not self._queue:
+            self.manifest.close()
+            self.io.close()
+            QTimer.singleShot(0, lambda: self.finished.emit(0))
+            return
+        for worker in self.workers:
+            worker.next()
+
+    def take(self):
+        return self._queue.popleft() if self._queue else None
+
+    def retry(self, job):
+        self._queue.append(job)
+
+    def worker_idle(self, worker):
+        self._busy.discard(worker)
+        if not self._busy:
+            self.manifest.close()
+            # Writes of jobs that timed out may still be running
+            self.io.close()
+            self.finished.emit(self.failures)
+
+    def write(self, path, producer, callback):
+        # callback(error) runs on the GUI thread once the write is done,
+        # with None on success. Each write has its own tag, so a retry of
+        # the same path never takes an earlier attempt's outcome.
+        tag = str(next(self._write_ids))
+        self._writes[tag] = callback
+        self.io.write(path, producer, tag)
+
+    def _written(self, tag, error):
+        callback = self._writes.pop(tag, None)
+        if callback is not None:
+            callback(error)
+
+    def record(self, job, status, path, save_ms):
+        if status != "ok":
+            self.failures += 1
+        self.manifest.write(json.dumps({
+            "url": job.url,
+            "status": status,
+            "output": path,
+            "attempts": job.attempt,
+            "load_ms": round(job.load_ms, 1) if job.load_ms is not None else None,
+            "save_ms": round(save_ms, 1) if save_ms is not None else None,
+            "total_ms": round((time.perf_counter() - job.started) * 1000, 1),
+            "error": job.error if status != "ok" else None,
+            "capture": job.report,
+        }) + "\n")
+        self.manifest.flush()
+
+    # MHTML is written by QtWebEngine's download machinery
+    def expect_download(self, path, callback):
+        self._downloads[os.path.abspath(path)] = callback
+
+    def on_download(self, item):
+        callback = self._downloads.pop(os.path.abspath(item.path()), None)
+        if callback is None:
+            item.cancel()
+            return
+        item.finished.connect(lambda: callback(item.state() == QWebEngineDownloadItem.DownloadCompleted))
+        item.accept()
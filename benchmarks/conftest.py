@@ -0,0 +1,189 @@
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Headless, and importable from the repository root whatever the working directory
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+# Chromium's sandbox refuses to start as root, which CI runners often are
+os.environ.setdefault("QTWEBENGINE_DISABLE_SANDBOX", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PyQt5.QtCore import QCoreApplication, QEventLoop
+
+# QtWebEngine has to be loaded before the QApplication is created
+try:
+    import PyQt5.QtWebEngineWidgets  # noqa: F401
+    WEBENGINE_ERROR = None
+except ImportError as e:
+    WEBENGINE_ERROR = str(e)
+
+from PyQt5.QtWidgets import QApplication
+from history_store import HistoryStore, visit_score
+
+HISTORY_SIZES = "1000,100000,1000000"
+# Seeds every generated data set, so runs compare like with like
+SEED = 20240601
+# Bytes served per download by the fixture server
+DOWNLOAD_SIZE = 256 * 1024
+
+
+def pytest_addoption(parser):
+    parser.addoption("--history-sizes", default=HISTORY_SIZES,
+                     help="comma-separated history sizes (pages) to benchmark at")
+
+
+def pytest_generate_tests(metafunc):
+    if "history_size" in metafunc.fixturenames:
+        sizes = [int(s) for s in metafunc.config.getoption("history_sizes").split(",") if s.strip()]
+        metafunc.parametrize("history_size", sizes, ids=[f"{size}pages" for size in sizes])
+
+
+def wait_until(predicate, timeout=10.0):
+    # Runs the event loop until predicate() holds
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("condition not reached within %.1fs" % timeout)
+        QCoreApplication.processEvents(QEventLoop.AllEvents, 10)
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    app = QApplication.instance() or QApplication(["gkm-benchmarks"])
+    yield app
+
+
+# --- local HTTP fixture server ---
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    # /page/<n>     a small deterministic HTML page linking to its neighbours
+    # /download/<n> DOWNLOAD_SIZE bytes of application/octet-stream
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "page" and parts[1].isdigit():
+            n = int(parts[1])
+            links = "".join(f'<li><a href="/page/{n + i}">Page {n + i}</a></li>' for i in range(1, 21))
+            body = (f"<!DOCTYPE html><html><head><title>Fixture page {n}</title></head>"
+                    f"<body><h1>Fixture page {n}</h1><ul>{links}</ul>"
+                    f"<p>{'Lorem ipsum dolor sit amet. ' * 40}</p></body></html>").encode('utf-8')
+            self._send(200, "text/html; charset=utf-8", body)
+        elif len(parts) == 2 and parts[0] == "download" and parts[1].isdigit():
+            self._send(200, "application/octet-stream", b"\0" * DOWNLOAD_SIZE,
+                       {"Content-Disposition": f'attachment; filename="file{parts[1]}.bin"'})
+        else:
+            self._send(404, "text/plain", b"not found")
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def http_server():
+    # Base URL of a server on a free loopback port; nothing leaves the machine
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fixture-http", daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+# --- history databases ---
+
+def build_history_db(path, size, base_url="http://127.0.0.1"):
+    # A history.db holding size distinct pages, visited over the last 90 days;
+    # the URLs are generated already in normalized form
+    HistoryStore(path).close()
+    rng = random.Random(SEED)
+    now = time.time()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    def rows():
+        for seq in range(1, size + 1):
+            last = now - (size - seq) * (90 * 86400 / size)
+            count = 1 + int(rng.expovariate(0.5))
+            url = f"{base_url}/page/{seq}?q={rng.randrange(10 ** 6)}"
+            yield (url, count, last - 86400, last, visit_score(last), seq)
+    conn.executemany("INSERT INTO pages (url, visit_count, first_visit, last_visit, frecency, seq) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows())
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def history_db_cache(tmp_path_factory):
+    # Databases are slow to generate at 1M pages, so each size is built once
+    directory = tmp_path_factory.mktemp("history")
+    built = {}
+
+    def get(size):
+        if size not in built:
+            path = str(directory / f"history-{size}.db")
+            build_history_db(path, size)
+            built[size] = path
+        return built[size]
+    return get
+
+
+@pytest.fixture
+def history_db(history_db_cache, history_size, tmp_path):
+    # A private copy of the history database for one benchmark
+    path = str(tmp_path / "history.db")
+    shutil.copyfile(history_db_cache(history_size), path)
+    return path
+
+
+def open_history(path, size):
+    # Retention limits are raised to the data set's size, so the store is
+    # measured in its steady state rather than while it expires pages
+    return HistoryStore(path, max_age_days=3650, max_pages=size * 2)
+
+
+# --- the browser window (needs QtWebEngine) ---
+
+@pytest.fixture
+def browser_window(request, qapp, http_server, tmp_path, monkeypatch):
+    # A GKM_Browser started in an empty profile directory with one tab on the
+    # fixture server; benchmarks parametrized by history_size get that history
+    if WEBENGINE_ERROR is not None:
+        pytest.skip(f"QtWebEngine unavailable: {WEBENGINE_ERROR}")
+    monkeypatch.chdir(tmp_path)
+    settings = {"restore_session": False, "homepage": f"{http_server}/page/0", "adblock_lists": []}
+    if "history_size" in request.fixturenames:
+        request.getfixturevalue("history_db")
+        size = request.getfixturevalue("history_size")
+        settings.update(history_max_age_days=3650, history_max_pages=size * 2)
+    with open("settings.json", "w") as f:
+        json.dump(settings, f)
+    import browser
+    window = browser.GKM_Browser(fast_launch=False)
+    loaded = []
+    window.current_browser().loadFinished.connect(loaded.append)
+    window.show()
+    wait_until(lambda: loaded, timeout=30)
+    yield window
+    window.close()
+    window.deleteLater()
+    QCoreApplication.processEvents()
@@ -0,0 +1,79 @@
+import os
+import random
+
+import pytest
+
+from adblock import DEFAULT_RULES, FilterEngine, load_engine, read_recorded_requests
+from conftest import SEED
+
+# Requests replayed per round
+REQUESTS = 5000
+# Rules in the generated filter list, about the size of EasyList's network rules
+SYNTHETIC_RULES = 20000
+RESOURCE_TYPES = ["script", "image", "stylesheet", "xmlhttprequest", "sub_frame", "other"]
+
+
+def synthetic_rules(count, rng):
+    rules = list(DEFAULT_RULES)
+    for i in range(count):
+        kind = rng.randrange(6)
+        if kind == 0:
+            rules.append(f"||ads{i}.example-ads.com^")
+        elif kind == 1:
+            rules.append(f"||track{i}.net^$third-party")
+        elif kind == 2:
+            rules.append(f"/banner{i}/*$image")
+        elif kind == 3:
+            rules.append(f"||cdn{i}.example.com/ads/*$script,domain=site{i % 500}.com")
+        elif kind == 4:
+            rules.append(f"@@||cdn{i}.example.com/ads/allowed.js")
+        else:
+            rules.append(f"example.com##.ad-slot-{i}")
+    return rules
+
+
+def synthetic_requests(count, rng):
+    # As on a typical page, most requests match no rule and a few percent are blocked
+    requests = []
+    for _ in range(count):
+        site = f"https://site{rng.randrange(1000)}.com/"
+        n = rng.randrange(SYNTHETIC_RULES * 5)
+        host = rng.choice([f"ads{n}.example-ads.com", f"track{n}.net", f"cdn{n}.example.com",
+                           f"static.site{rng.randrange(1000)}.com"])
+        path = rng.choice(["/ads/show.js", f"/banner{n}/top.png", "/assets/app.js", "/api/v1/items?page=2"])
+        requests.append((f"https://{host}{path}", site, rng.choice(RESOURCE_TYPES)))
+    return requests
+
+
+@pytest.fixture(scope="module")
+def workload():
+    # GKM_BENCH_FILTERS (list paths, os.pathsep-separated) and
+    # GKM_BENCH_REQUESTS (a file from the browser's request recorder)
+    # replay real data instead of the generated set
+    rng = random.Random(SEED)
+    lists = [p for p in os.environ.get("GKM_BENCH_FILTERS", "").split(os.pathsep) if p]
+    if lists:
+        engine = load_engine(lists)
+    else:
+        engine = FilterEngine()
+        engine.add_rules(synthetic_rules(SYNTHETIC_RULES, rng))
+    recorded = os.environ.get("GKM_BENCH_REQUESTS")
+    requests = read_recorded_requests(recorded) if recorded else synthetic_requests(REQUESTS, rng)
+    return engine, requests, "recorded" if recorded else "synthetic"
+
+
+def test_should_block(benchmark, workload):
+    engine, requests, source = workload
+
+    def replay():
+        blocked = 0
+        for url, first_party, resource_type in requests:
+            if engine.should_block(url, first_party, resource_type):
+                blocked += 1
+        return blocked
+
+    blocked = benchmark(replay)
+    benchmark.extra_info.update(requests=len(requests), blocked=blocked, source=source)
+    # No timings are kept under --benchmark-disable
+    if benchmark.stats:
+        benchmark.extra_info["mean_us_per_request"] = benchmark.stats.stats.mean / len(requests) * 1e6
@@ -0,0 +1,75 @@
+import itertools
+
+from PyQt5.QtCore import QUrl
+from PyQt5.QtWidgets import QListView
+
+from conftest import wait_until
+
+# Everything here drives a real GKM_Browser window and is skipped where
+# QtWebEngine cannot be loaded
+
+
+def _close_extra_tabs(window):
+    while window.tab_widget.count() > 1:
+        window.close_tab(window.tab_widget.count() - 1)
+
+
+def test_add_new_tab(benchmark, browser_window, http_server):
+    # The synchronous part: the view and page are created and the tab shown
+    pages = itertools.count(1)
+    benchmark.pedantic(lambda: browser_window.add_new_tab(QUrl(f"{http_server}/page/{next(pages)}"), "New Tab"),
+                       setup=lambda: _close_extra_tabs(browser_window), rounds=30, warmup_rounds=2)
+
+
+def test_new_tab_until_loaded(benchmark, browser_window, http_server):
+    # From add_new_tab until the fixture page has finished loading
+    pages = itertools.count(1)
+
+    def open_tab():
+        browser_window.add_new_tab(QUrl(f"{http_server}/page/{next(pages)}"), "New Tab")
+        loaded = []
+        browser_window.current_browser().loadFinished.connect(loaded.append)
+        wait_until(lambda: loaded, timeout=30)
+
+    benchmark.pedantic(open_tab, setup=lambda: _close_extra_tabs(browser_window), rounds=20, warmup_rounds=2)
+
+
+def test_navigation_to_history(benchmark, browser_window, http_server, history_size):
+    # A navigation in the current tab, through update_history and
+    # save_history, until the visit is committed to history.db
+    pages = itertools.count(10 ** 7)
+    view = browser_window.current_browser()
+
+    def navigate():
+        url = f"{http_server}/page/{next(pages)}"
+        seen = []
+        view.urlChanged.connect(seen.append)
+        view.setUrl(QUrl(url))
+        wait_until(lambda: seen)
+        view.urlChanged.disconnect(seen.append)
+        browser_window.save_history()
+        browser_window.history.flush()
+
+    benchmark.extra_info["history_size"] = history_size
+    benchmark.pedantic(navigate, rounds=20, warmup_rounds=2)
+
+
+def test_show_history(benchmark, browser_window, history_size):
+    # show_history until its dialog lists the first page of history
+    dialogs = []
+
+    def open_history():
+        before = set(browser_window.findChildren(QListView))
+        browser_window.show_history()
+        view = (set(browser_window.findChildren(QListView)) - before).pop()
+        wait_until(lambda: view.model().rowCount() > 0)
+        dialogs.append(view.window())
+
+    def close_dialogs():
+        while dialogs:
+            dialog = dialogs.pop()
+            dialog.close()
+            dialog.deleteLater()
+
+    benchmark.extra_info["history_size"] = history_size
+    benchmark.pedantic(open_history, teardown=close_dialogs, rounds=20, warmup_rounds=2)
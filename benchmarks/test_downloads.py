@@ -0,0 +1,143 @@
+import itertools
+
+import pytest
+from PyQt5.QtCore import QObject, QTimer, QUrl, pyqtSignal
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkReply, QNetworkRequest
+from PyQt5.QtWidgets import QTableView
+
+from conftest import DOWNLOAD_SIZE, wait_until
+from downloads import DownloadManager
+
+_ids = itertools.count(1)
+
+
+class BenchDownload(QObject):
+    """Stands in for QWebEngineDownloadItem, with the same signals and the
+    parts of its interface DownloadManager uses. Progress is driven by the
+    benchmark through advance()."""
+
+    DownloadInProgress, DownloadCompleted, DownloadCancelled, DownloadInterrupted = 1, 2, 3, 4
+
+    downloadProgress = pyqtSignal("qint64", "qint64")
+    finished = pyqtSignal()
+
+    def __init__(self, url, total):
+        super().__init__()
+        self._id = next(_ids)
+        self._url = QUrl(url)
+        self._total = total
+        self._received = 0
+        self._state = self.DownloadInProgress
+        self.paused = False
+
+    def id(self):
+        return self._id
+
+    def url(self):
+        return self._url
+
+    def totalBytes(self):
+        return self._total
+
+    def receivedBytes(self):
+        return self._received
+
+    def state(self):
+        return self._state
+
+    def accept(self):
+        pass
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def cancel(self):
+        self._state = self.DownloadCancelled
+        self.finished.emit()
+
+    def advance(self, count):
+        self._received = min(self._total, self._received + count)
+        self.downloadProgress.emit(self._received, self._total)
+
+
+class NetworkDownload(BenchDownload):
+    """A BenchDownload whose bytes really come from the fixture server,
+    fetched (and discarded) with QNetworkAccessManager once it is resumed."""
+
+    def __init__(self, manager, url):
+        super().__init__(url, DOWNLOAD_SIZE)
+        self._manager = manager
+        self._reply = None
+
+    def accept(self):
+        # DownloadManager pauses queued downloads right after accepting them
+        QTimer.singleShot(0, self._start)
+
+    def resume(self):
+        super().resume()
+        self._start()
+
+    def _start(self):
+        if self.paused or self._reply is not None:
+            return
+        self._reply = self._manager.get(QNetworkRequest(self._url))
+        self._reply.readyRead.connect(lambda: self._reply.readAll())
+        self._reply.downloadProgress.connect(self._on_progress)
+        self._reply.finished.connect(self._on_finished)
+
+    def _on_progress(self, received, total):
+        self._received = received
+        self.downloadProgress.emit(received, total)
+
+    def _on_finished(self):
+        ok = self._reply.error() == QNetworkReply.NoError
+        self._state = self.DownloadCompleted if ok else self.DownloadInterrupted
+        self._reply.deleteLater()
+        self.finished.emit()
+
+
+@pytest.mark.parametrize("items", [100, 1000])
+def test_progress_tick(benchmark, qapp, tmp_path, items):
+    # Every download reports progress once, then the refresh timer's update
+    # reaches a visible downloads view
+    manager = DownloadManager({"max_concurrent_downloads": items}, str(tmp_path / "downloads.jsonl"))
+    view = QTableView()
+    view.setModel(manager)
+    view.resize(800, 600)
+    view.show()
+    downloads = [BenchDownload(f"http://127.0.0.1/download/{i}", 10 ** 9) for i in range(items)]
+    for i, item in enumerate(downloads):
+        manager.add(item, str(tmp_path / f"file{i}.bin"))
+
+    def tick():
+        for item in downloads:
+            item.advance(64 * 1024)
+        manager.refresh()
+        qapp.processEvents()
+
+    benchmark.extra_info["items"] = items
+    benchmark(tick)
+    view.close()
+
+
+@pytest.mark.parametrize("items", [50])
+def test_concurrent_downloads(benchmark, qapp, http_server, tmp_path, items):
+    # items downloads started at once from the fixture server, queued by the
+    # manager's concurrency limit, timed until the last one finishes
+    network = QNetworkAccessManager()
+
+    def run():
+        manager = DownloadManager({}, str(tmp_path / "downloads.jsonl"))
+        done = []
+        for i in range(items):
+            item = NetworkDownload(network, f"{http_server}/download/{i}")
+            item.finished.connect(lambda: done.append(1))
+            manager.add(item, str(tmp_path / f"file{i}.bin"))
+        wait_until(lambda: len(done) == items, timeout=60)
+        manager.deleteLater()
+
+    benchmark.extra_info.update(items=items, bytes_each=DOWNLOAD_SIZE)
+    benchmark.pedantic(run, rounds=5, warmup_rounds=1)
@@ -0,0 +1,81 @@
+import itertools
+import time
+
+import pytest
+from PyQt5.QtWidgets import QListView
+
+from conftest import open_history, wait_until
+from list_models import HistoryModel
+from omnibox import OmniboxIndex
+
+
+@pytest.fixture
+def store(history_db, history_size):
+    store = open_history(history_db, history_size)
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("kind", ["new", "revisit"])
+def test_visit_persisted(benchmark, store, history_size, http_server, kind):
+    # The store and omnibox calls GKM_Browser.update_history makes for one
+    # navigation, timed until the visit is committed. It mirrors that method
+    # rather than calling it, which needs a window and so QtWebEngine;
+    # test_browser.py covers the real path. The omnibox starts empty: its
+    # per-visit cost is bounded by the top-k lists, not by the index size.
+    omnibox = OmniboxIndex()
+    if kind == "new":
+        urls = (f"{http_server}/page/{n}?utm_source=bench" for n in itertools.count())
+    else:
+        urls = itertools.cycle([row[1] for row in store.page(None, 1000)])
+
+    def navigate():
+        url = next(urls)
+        now = time.time()
+        store.append(url, now)
+        omnibox.add_visit(url, now)
+        # The store derives its key on the writer; save_history only requests
+        # a flush, and waiting for it is what makes this "persisted"
+        store.flush()
+
+    benchmark.extra_info.update(history_size=history_size, kind=kind)
+    benchmark(navigate)
+
+
+def test_show_history(benchmark, qapp, store, history_size):
+    # The history view from show_history opened and filled with its first page
+    views = []
+
+    def open_view():
+        model = HistoryModel(store)
+        view = QListView()
+        view.setUniformItemSizes(True)
+        view.setModel(model)
+        model.setParent(view)
+        view.resize(600, 400)
+        view.show()
+        wait_until(lambda: model.rowCount() > 0)
+        views.append(view)
+
+    def close_views():
+        while views:
+            view = views.pop()
+            view.close()
+            view.deleteLater()
+
+    benchmark.extra_info["history_size"] = history_size
+    benchmark.pedantic(open_view, teardown=close_views, rounds=20, warmup_rounds=2)
+
+
+@pytest.mark.parametrize("text", ["page/4", "no-such-page"])
+def test_filter_history(benchmark, qapp, store, history_size, text):
+    # Typing into the history view's filter box: one filtered first page
+    model = HistoryModel(store)
+
+    def apply_filter():
+        model.set_filter(text)
+        if model.canFetchMore():
+            model.fetchMore()
+
+    benchmark.extra_info.update(history_size=history_size, filter=text)
+    benchmark(apply_filter)
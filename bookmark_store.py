@@ -0,0 +1,257 @@
+import html
+import json
+import os
+import re
+import time
+from io_service import AtomicFile
+
+BOOKMARKS_VERSION = 2
+# Bytes of a bookmarks HTML file parsed at a time
+READ_CHUNK = 64 * 1024
+# An unclosed <A> or <H3> is given up on after this many characters
+MAX_ELEMENT = 64 * 1024
+
+
+class Bookmark:
+    __slots__ = ("url", "name", "folder", "tags", "added")
+
+    def __init__(self, url, name="", folder="", tags=(), added=None):
+        self.url = url
+        self.name = name or url
+        # "/"-separated path, "" for the top level
+        self.folder = folder
+        self.tags = tuple(tags)
+        self.added = added or time.time()
+
+    def to_json(self):
+        return {"url": self.url, "name": self.name, "folder": self.folder,
+                "tags": list(self.tags), "added": self.added}
+
+
+# Scheme and authority of a hierarchical URL
+_ORIGIN = re.compile(r"([A-Za-z][A-Za-z0-9+.-]*://)([^/?#]*)")
+
+
+def _key(url):
+    # Only the scheme and host, which never distinguish pages by case, are
+    # folded; query and fragment may pick a different page and are kept
+    match = _ORIGIN.match(url)
+    if match is None:
+        return url
+    userinfo, at, host = match.group(2).rpartition("@")
+    return match.group(1).lower() + userinfo + at + host.lower() + url[match.end():]
+
+
+class BookmarkStore:
+    """Bookmarks with folders and tags, indexed by URL.
+
+    Entries are kept in a dict keyed by URL, with only scheme and host
+    case-folded, so duplicate checks are O(1), and in an append-only list
+    in insertion order that views read by position. The file is
+    a versioned JSON document; older files (a list of {"name", "url"}
+    dicts or bare URL strings) are migrated when loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._items = {}
+        self._order = []
+        self.load()
+
+    def load(self):
+        data = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    content = f.read().strip()
+                    data = json.loads(content) if content else None
+            except (json.JSONDecodeError, IOError):
+                data = None
+        self._items = {}
+        self._order = []
+        if isinstance(data, list):
+            # Version 1: a flat list of dicts or bare URL strings
+            entries = [e if isinstance(e, dict) else {"url": e} for e in data]
+        elif isinstance(data, dict):
+            entries = data.get("bookmarks", [])
+        else:
+            entries = []
+        for entry in entries:
+            if isinstance(entry, dict) and isinstance(entry.get("url"), str):
+                self.add(entry["url"], entry.get("name", ""), entry.get("folder", ""),
+                         entry.get("tags", ()), entry.get("added"))
+
+    def to_json(self):
+        return {"version": BOOKMARKS_VERSION, "bookmarks": [b.to_json() for b in self._items.values()]}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        # Bookmarks added while iterating are reached too
+        return iter(self._order)
+
+    def entries(self, start, stop):
+        # Bookmarks start to stop in insertion order; positions never change
+        return self._order[start:stop]
+
+    def __contains__(self, url):
+        return _key(url) in self._items
+
+    def add(self, url, name="", folder="", tags=(), added=None):
+        # Returns the new Bookmark, or None if the page is already bookmarked
+        key = _key(url)
+        if not url or key in self._items:
+            return None
+        bookmark = Bookmark(url, name, folder.strip("/"), tags, added)
+        self._items[key] = bookmark
+        self._order.append(bookmark)
+        return bookmark
+
+    def folders(self):
+        folders = set()
+        for bookmark in self._items.values():
+            path = bookmark.folder
+            while path:
+                folders.add(path)
+                path = path.rpartition("/")[0]
+        return sorted(folders)
+
+    # --- Netscape bookmark file format, as exported by every browser ---
+
+    def import_html(self, path):
+        # Generator: adds bookmarks as the file is parsed and yields each
+        # new one, so callers can process a large import in slices
+        parser = _NetscapeParser()
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if chunk:
+                    parser.feed(chunk)
+                else:
+                    parser.close()
+                for url, name, folder, tags, added in parser.take():
+                    bookmark = self.add(url, name, folder, tags, added)
+                    if bookmark is not None:
+                        yield bookmark
+                if not chunk:
+                    return
+
+    def export_html(self, path):
+        # Written line by line to a temporary file that replaces path at the end
+        by_folder = {}
+        for bookmark in self._items.values():
+            by_folder.setdefault(bookmark.folder, []).append(bookmark)
+        with AtomicFile(path, 'w', encoding='utf-8') as f:
+            f.write("<!DOCTYPE NETSCAPE-Bookmark-file-1>\n"
+                    '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+                    "<TITLE>Bookmarks</TITLE>\n<H1>Bookmarks</H1>\n<DL><p>\n")
+            self._export_folder(f, "", by_folder, self.folders(), 1)
+            f.write("</DL><p>\n")
+        return len(self._items)
+
+    def _export_folder(self, f, folder, by_folder, folders, depth):
+        indent = "    " * depth
+        for bookmark in by_folder.get(folder, ()):
+            tags = f' TAGS="{html.escape(",".join(bookmark.tags))}"' if bookmark.tags else ""
+            f.write(f'{indent}<DT><A HREF="{html.escape(bookmark.url)}" ADD_DATE="{int(bookmark.added)}"{tags}>'
+                    f'{html.escape(bookmark.name)}</A>\n')
+        prefix = folder + "/" if folder else ""
+        for child in folders:
+            if child.startswith(prefix) and "/" not in child[len(prefix):]:
+                f.write(f"{indent}<DT><H3>{html.escape(child[len(prefix):])}</H3>\n{indent}<DL><p>\n")
+                self._export_folder(f, child, by_folder, folders, depth + 1)
+                f.write(f"{indent}</DL><p>\n")
+
+
+_TOKEN = re.compile(r"<(/?)(a|h3|dl)\b([^>]*)>", re.IGNORECASE)
+_ATTR = re.compile(r'([a-z_]+)\s*=\s*"([^"]*)"', re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+
+
+def _text(markup):
+    return html.unescape(_TAG.sub("", markup)).strip()
+
+
+class _NetscapeParser:
+    """Incremental parser for Netscape bookmark files.
+
+    The format only needs <A>, <H3> and <DL>, so a regex tokenizer does
+    instead of a general HTML parser. Only the folder path and an
+    unfinished tail of input are kept between chunks, so memory stays
+    constant however large the file is; finished entries are collected
+    until take() is called.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._folders = []
+        self._pending_folder = None
+        self._open = None  # (tag, attributes, text start) of an <A> or <H3> awaiting its end tag
+        self._entries = []
+
+    def feed(self, data):
+        self._buffer += data
+        self._parse(final=False)
+
+    def close(self):
+        self._parse(final=True)
+
+    def _parse(self, final):
+        buffer = self._buffer
+        consumed = 0
+        for match in _TOKEN.finditer(buffer):
+            closing, tag, attrs = match.group(1), match.group(2).lower(), match.group(3)
+            if self._open is not None:
+                # Inside <A> or <H3> only its end tag matters
+                if closing and tag == self._open[0]:
+                    open_tag, open_attrs, text_start = self._open
+                    self._finish(open_tag, open_attrs, buffer[text_start:match.start()])
+                    self._open = None
+                    consumed = match.end()
+                continue
+            consumed = match.end()
+            if tag == "dl":
+                if not closing:
+                    # The list following a heading holds that folder's contents
+                    self._folders.append(self._pending_folder)
+                    self._pending_folder = None
+                elif self._folders:
+                    self._folders.pop()
+            elif not closing:
+                self._open = (tag, attrs, match.end())
+
+        if final:
+            self._buffer = ""
+            self._open = None
+        elif self._open is not None:
+            # Carry the unfinished element over to the next chunk, unless it
+            # is never going to close
+            tag, attrs, text_start = self._open
+            self._buffer = buffer[text_start:]
+            self._open = (tag, attrs, 0) if len(self._buffer) < MAX_ELEMENT else None
+        else:
+            # Carry over a tag cut off by the chunk boundary
+            cut = buffer.rfind("<", consumed)
+            self._buffer = buffer[cut:] if cut >= 0 else ""
+
+    def _finish(self, tag, attrs, markup):
+        text = _text(markup)
+        if tag == "h3":
+            self._pending_folder = text.replace("/", "-") or None
+            return
+        attrs = {k.lower(): html.unescape(v) for k, v in _ATTR.findall(attrs)}
+        href = attrs.get("href", "")
+        if not href.startswith(("http://", "https://", "ftp://", "file://")):
+            return
+        try:
+            added = int(attrs.get("add_date") or 0) or None
+        except ValueError:
+            added = None
+        tags = [t.strip() for t in attrs.get("tags", "").split(",") if t.strip()]
+        folder = "/".join(f for f in self._folders if f)
+        self._entries.append((href, text, folder, tags, added))
+
+    def take(self):
+        entries, self._entries = self._entries, []
+        return entries
@@ -1,21 +1,66 @@
+from startup_trace import trace
 import sys
+import argparse
 import json
 import os
+import sqlite3
+import threading
+
+if __name__ == "__main__" and not any(arg.startswith("-") for arg in sys.argv[1:]):
+    # A plain launch (just URLs, as from a URL handler) goes to the running
+    # browser, if any, before the widget and Chromium modules are loaded.
+    # Launches with options start a window of their own.
+    from instance import hand_off
+    if hand_off(sys.argv[1:]):
+        sys.exit(0)
+
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QToolBar, QAction, QLineEdit, QFileDialog, QMessageBox, 
-    QListWidget, QVBoxLayout, QWidget, QTabWidget, QMenu, QInputDialog, QPushButton, 
-    QHBoxLayout, QComboBox
+    QVBoxLayout, QWidget, QTabWidget, QMenu, QInputDialog, QPushButton, 
+    QHBoxLayout, QComboBox, QCompleter, QListView, QTableView, QHeaderView, QAbstractItemView,
+    QTableWidget, QTableWidgetItem, QCheckBox
 )
-from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEngineProfile, QWebEnginePage
-from PyQt5.QtCore import QUrl, Qt, QEvent, QSize
-from PyQt5.QtGui import QIcon, QPixmap, QImage
-import datetime
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineScript
+from PyQt5.QtWebEngineCore import QWebEngineUrlRequestInterceptor, QWebEngineUrlRequestInfo
+from PyQt5.QtCore import QUrl, Qt, QEvent, QSize, QTimer, QStringListModel, pyqtSignal
+import time
+from history_store import HistoryStore, normalize_url, MAX_AGE_DAYS as HISTORY_MAX_AGE_DAYS, MAX_PAGES as HISTORY_MAX_PAGES
+from omnibox import OmniboxIndex
+from list_models import HistoryModel, BookmarkModel, PageTextModel, URL_ROLE
+from fulltext_index import FullTextIndex, INDEX_DIR, MAX_DOCS, MAX_AGE_DAYS, MAX_BYTES
+from adblock import load_engine
+from profiles import ProfileManager
+from tab_lifecycle import TabLifecycleManager
+from session import TabPlaceholder, load_session, save_session
+from downloads import DownloadManager
+from page_metrics import PageMetrics, SUMMARY_METRICS
+from user_scripts import UserScriptManager
+from io_service import IOService
+from page_capture import FullPageCapture, IMAGE_FORMATS
+from instance import InstanceServer, split_urls
+from bookmark_store import BookmarkStore
+from site_settings import SiteSettings, SitePage, SITE_SETTINGS_FILE, SETTING_NAMES, SETTING_LABELS
+from batch_capture import BatchCapture, read_url_file, FORMATS, WORKERS, TIMEOUT_S, RETRIES
+
+trace.record("imports", trace.origin, time.perf_counter())
 
 # Paths for bookmarks, history, and settings
 BOOKMARK_FILE = "bookmarks.json"
 HISTORY_FILE = "history.json"
+HISTORY_DB = "history.db"
 SETTINGS_FILE = "settings.json"
-DOWNLOADS = []
+# Compiled filter lists, kept in the profile directory
+ADBLOCK_CACHE = "adblock.cache"
+# Filter lists compiled by the ad blocker unless settings.json names others
+ADBLOCK_LISTS = ["easylist.txt"]
+# Delay before open tabs are written to session.json after a change
+SESSION_SAVE_DELAY_MS = 1000
+# Longest the startup trace waits for the first page load after startup work is done
+TRACE_LOAD_TIMEOUT_MS = 15000
+# History rows merged into the omnibox index at a time while it is built
+OMNIBOX_BUILD_CHUNK = 5000
+# Bookmarks imported per slice between events
+BOOKMARK_IMPORT_CHUNK = 2000
 
 # Available search engines
 SEARCH_ENGINES = {
@@ -24,22 +69,134 @@ SEARCH_ENGINES = {
     "DuckDuckGo": "https://duckduckgo.com/?q={}"
 }
 
+# Filter-list resource type for each request type reported by QtWebEngine
+RESOURCE_TYPE_NAMES = {
+    QWebEngineUrlRequestInfo.ResourceTypeMainFrame: "document",
+    QWebEngineUrlRequestInfo.ResourceTypeSubFrame: "subdocument",
+    QWebEngineUrlRequestInfo.ResourceTypeStylesheet: "stylesheet",
+    QWebEngineUrlRequestInfo.ResourceTypeScript: "script",
+    QWebEngineUrlRequestInfo.ResourceTypeImage: "image",
+    QWebEngineUrlRequestInfo.ResourceTypeFontResource: "font",
+    QWebEngineUrlRequestInfo.ResourceTypeObject: "object",
+    QWebEngineUrlRequestInfo.ResourceTypeMedia: "media",
+    QWebEngineUrlRequestInfo.ResourceTypeWorker: "script",
+    QWebEngineUrlRequestInfo.ResourceTypeSharedWorker: "script",
+    QWebEngineUrlRequestInfo.ResourceTypeServiceWorker: "script",
+    QWebEngineUrlRequestInfo.ResourceTypeFavicon: "image",
+    QWebEngineUrlRequestInfo.ResourceTypeXhr: "xmlhttprequest",
+    QWebEngineUrlRequestInfo.ResourceTypePing: "ping",
+    QWebEngineUrlRequestInfo.ResourceTypePluginResource: "object",
+}
+
+
+class AdBlockInterceptor(QWebEngineUrlRequestInterceptor):
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.enabled = False
+        # Set GKM_ADBLOCK_RECORD to a file path to record requests for adblock.py's benchmark
+        record_path = os.environ.get("GKM_ADBLOCK_RECORD")
+        self.record_file = open(record_path, 'a', encoding='utf-8') if record_path else None
+
+    def interceptRequest(self, info):
+        url = info.requestUrl().toString()
+        first_party = info.firstPartyUrl().toString()
+        resource_type = RESOURCE_TYPE_NAMES.get(info.resourceType(), "other")
+        if self.record_file:
+            self.record_file.write(f"{url}\t{first_party}\t{resource_type}\n")
+        if self.enabled and self.engine and self.engine.should_block(url, first_party, resource_type):
+            info.block(True)
+
+    def close(self):
+        if self.record_file:
+            self.record_file.close()
+            self.record_file = None
+
+
 class GKM_Browser(QMainWindow):
-    def __init__(self):
+    # (generation, index) from the thread building the omnibox index
+    omnibox_built = pyqtSignal(int, object)
+
+    def __init__(self, fast_launch=None):
         super().__init__()
         self.setWindowTitle("GKM Browser Pro 🌐")
         self.setGeometry(200, 100, 1200, 800)
 
         self.incognito_mode = False
-        self.dark_mode_enabled = False
         self.ad_block_enabled = False
-        self.bookmarks = self.load_bookmarks()
-        self.history = self.load_history()
-        self.settings = self.load_settings()
+        with trace.span("load_bookmarks"):
+            self.bookmarks = self.load_bookmarks()
+        self._bookmark_import = None
+        with trace.span("load_settings"):
+            self.settings = self.load_settings()
+        # File saves are encoded and written on a thread pool
+        self.io = IOService(parent=self)
+        self.io.saved.connect(self.on_io_saved)
+        self.io.failed.connect(self.on_io_failed)
+        # Replies for remote viewport captures, keyed by output path
+        self._remote_captures = {}
+        with trace.span("load_history"):
+            self.history = self.load_history()
+        # Fast launch shows the window first and leaves everything that isn't
+        # needed for the first frame to run_startup_tasks
+        self.fast_launch = self.settings.get("fast_launch", False) if fast_launch is None else fast_launch
+        self._startup_tasks = []
         self.search_engine = self.settings.get("search_engine", SEARCH_ENGINES["Google"])
         self.search_engine_name = self.settings.get("search_engine_name", "Google")
         self.homepage = self.settings.get("homepage", "https://google.com")
 
+        # Live download list, also the model behind the downloads view
+        self.downloads = DownloadManager(self.settings, parent=self)
+
+        # Dark mode and cosmetic filtering run as document-start scripts on every profile
+        self.dark_mode_enabled = self.settings.get("dark_mode", False)
+        self.user_scripts = UserScriptManager(self)
+        self.user_scripts.set_dark_mode(self.dark_mode_enabled, self.settings.get("dark_mode_exclusions", []),
+                                        self.settings.get("dark_mode_site_css", {}))
+
+        # Opt-in full-text index of visited pages, searched from the history view
+        self.fulltext = None
+        if self.settings.get("index_page_text", False):
+            self.fulltext = self.open_fulltext_index()
+
+        # Per-site page settings and lite mode, applied as each navigation starts
+        self.site_settings = SiteSettings(SITE_SETTINGS_FILE, self)
+        self.site_settings.changed.connect(self.site_settings_changed)
+
+        # Page-load timings per tab, aggregated per host
+        self.page_metrics = PageMetrics(self.settings, self)
+
+        # Shared profiles for normal and incognito tabs. Parented to the
+        # application so they outlive the pages of this window.
+        self.profiles = ProfileManager(self.settings, QApplication.instance())
+        self.profiles.profile_created.connect(self.setup_profile)
+
+        # Network-level ad blocker, installed on every profile
+        self.ad_blocker = AdBlockInterceptor(None, self)
+        if self.fast_launch:
+            self._startup_tasks.append(self.compile_ad_block)
+        else:
+            self.compile_ad_block()
+
+        # Omnibox suggestions. History is indexed on a worker thread after
+        # the first frame, and the finished index replaces this one.
+        self.omnibox = OmniboxIndex()
+        self._omnibox_started = None
+        # Visits made while the worker runs, replayed into its index
+        self._omnibox_visits = None
+        # Bumped by clear_history, so a build started before it is dropped
+        self._omnibox_generation = 0
+        self.omnibox_built.connect(self.on_omnibox_built)
+        if self.fast_launch:
+            self._startup_tasks.append(self.index_bookmarks)
+        else:
+            self.index_bookmarks()
+        self._startup_tasks.append(self.build_omnibox_index)
+
+        # Toolbar and menu controls that act on the current page, disabled
+        # while there is no tab
+        self.page_controls = []
+
         # Tab widget for multiple tabs
         self.tab_widget = QTabWidget()
         self.tab_widget.setTabsClosable(True)
@@ -47,12 +204,84 @@ class GKM_Browser(QMainWindow):
         self.tab_widget.currentChanged.connect(self.update_navigation_buttons)
         self.setCentralWidget(self.tab_widget)
 
-        # Default profile for non-incognito mode
-        self.default_profile = QWebEngineProfile.defaultProfile()
-        self.add_new_tab(QUrl(self.homepage), "New Tab")
+        # Freezes and discards background tabs to keep renderer memory bounded
+        self.lifecycle = TabLifecycleManager(self.settings, self)
+        self.tab_widget.currentChanged.connect(
+            lambda index: self.lifecycle.activate(self.tab_widget.widget(index)) if index >= 0 else None
+        )
+
+        # Open tabs are saved shortly after they change; restored tabs stay
+        # placeholders until they are first selected
+        self._restoring_session = False
+        self.session_timer = QTimer(self)
+        self.session_timer.setSingleShot(True)
+        self.session_timer.setInterval(SESSION_SAVE_DELAY_MS)
+        self.session_timer.timeout.connect(self.save_session)
+        self.tab_widget.currentChanged.connect(self.restore_placeholder)
+
+        # URLs from the command line or later launches wait for the initial
+        # tabs, so the session opens first and they still end up selected
+        self._initial_tabs_open = False
+        self._queued_urls = []
+        trace.expect("first_load_finished")
+        if self.fast_launch:
+            self._startup_tasks.insert(0, self.open_initial_tabs)
+        else:
+            self.open_initial_tabs()
         
         self.create_navbar()
         self.create_menubar()
+        self.update_navigation_buttons(self.tab_widget.currentIndex())
+
+        # Deferred startup work begins once the first frame has been painted
+        self.tab_widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if obj is self.tab_widget and event.type() == QEvent.Paint:
+            self.tab_widget.removeEventFilter(self)
+            trace.mark("first_paint")
+            QTimer.singleShot(0, self.run_startup_tasks)
+        return super().eventFilter(obj, event)
+
+    def run_startup_tasks(self):
+        # One task per event-loop turn so input stays responsive; a task that
+        # returns True has more to do and runs again
+        if not self._startup_tasks:
+            # The first page usually finishes loading after the startup
+            # tasks; the trace waits for it, but not forever
+            trace.finish()
+            QTimer.singleShot(TRACE_LOAD_TIMEOUT_MS, lambda: trace.finish(force=True))
+            return
+        task = self._startup_tasks.pop(0)
+        if task():
+            self._startup_tasks.insert(0, task)
+        QTimer.singleShot(0, self.run_startup_tasks)
+
+    def open_initial_tabs(self):
+        with trace.span("open_initial_tabs"):
+            session = load_session() if self.settings.get("restore_session", True) else None
+            if session:
+                self.restore_session(session)
+            elif not self._queued_urls:
+                self.add_new_tab(QUrl(self.homepage), "New Tab")
+        self._initial_tabs_open = True
+        urls, self._queued_urls = self._queued_urls, []
+        self.open_urls(urls)
+
+    def open_urls(self, urls):
+        # Each in a new tab, the last one selected
+        if not self._initial_tabs_open:
+            self._queued_urls.extend(urls)
+            return
+        for url in urls:
+            self.add_new_tab(QUrl.fromUserInput(url), "New Tab")
+
+    def compile_ad_block(self):
+        with trace.span("adblock_compile"):
+            self.ad_blocker.engine = load_engine(self.settings.get("adblock_lists", ADBLOCK_LISTS),
+                                                 os.path.join(self.profiles.storage_path, ADBLOCK_CACHE))
+        if self.ad_block_enabled:
+            self.user_scripts.set_cosmetic_filter(self.ad_blocker.engine)
 
     def create_navbar(self):
         self.navbar = QToolBar()
@@ -64,32 +293,38 @@ class GKM_Browser(QMainWindow):
         self.back_btn.setToolTip("Back")
         self.back_btn.triggered.connect(lambda: self.current_browser().back())
         self.navbar.addAction(self.back_btn)
+        self.page_controls.append(self.back_btn)
 
         self.forward_btn = QAction("→", self)
         self.forward_btn.setToolTip("Forward")
         self.forward_btn.triggered.connect(lambda: self.current_browser().forward())
         self.navbar.addAction(self.forward_btn)
+        self.page_controls.append(self.forward_btn)
 
         self.reload_btn = QAction("⟳", self)
         self.reload_btn.setToolTip("Reload")
         self.reload_btn.triggered.connect(lambda: self.current_browser().reload())
         self.navbar.addAction(self.reload_btn)
+        self.page_controls.append(self.reload_btn)
 
         # Zoom controls
         zoom_in_btn = QAction("🔍+", self)
         zoom_in_btn.setToolTip("Zoom In")
         zoom_in_btn.triggered.connect(self.zoom_in)
         self.navbar.addAction(zoom_in_btn)
+        self.page_controls.append(zoom_in_btn)
 
         zoom_out_btn = QAction("🔍-", self)
         zoom_out_btn.setToolTip("Zoom Out")
         zoom_out_btn.triggered.connect(self.zoom_out)
         self.navbar.addAction(zoom_out_btn)
+        self.page_controls.append(zoom_out_btn)
 
         zoom_reset_btn = QAction("🔍", self)
         zoom_reset_btn.setToolTip("Reset Zoom")
         zoom_reset_btn.triggered.connect(self.zoom_reset)
         self.navbar.addAction(zoom_reset_btn)
+        self.page_controls.append(zoom_reset_btn)
 
         # New tab button
         new_tab_btn = QAction("➕", self)
@@ -111,6 +346,13 @@ class GKM_Browser(QMainWindow):
         self.url_bar = QLineEdit()
         self.url_bar.setToolTip("Enter URL or search query")
         self.url_bar.returnPressed.connect(self.navigate_to_url)
+        self.url_completer_model = QStringListModel(self)
+        self.url_completer = QCompleter(self.url_completer_model, self)
+        # Ranking is done by the omnibox index, the completer only displays it
+        self.url_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.url_completer.activated[str].connect(self.open_suggestion)
+        self.url_bar.setCompleter(self.url_completer)
+        self.url_bar.textEdited.connect(self.update_url_suggestions)
         self.navbar.addWidget(self.url_bar)
 
         # Find in page
@@ -120,12 +362,14 @@ class GKM_Browser(QMainWindow):
         self.find_bar.setToolTip("Search text on page")
         self.find_bar.returnPressed.connect(self.find_in_page)
         self.navbar.addWidget(self.find_bar)
+        self.page_controls.append(self.find_bar)
 
         # Bookmark
         bookmark_btn = QAction("★", self)
         bookmark_btn.setToolTip("Add Bookmark")
         bookmark_btn.triggered.connect(self.add_bookmark)
         self.navbar.addAction(bookmark_btn)
+        self.page_controls.append(bookmark_btn)
 
         view_bookmarks_btn = QAction("📑", self)
         view_bookmarks_btn.setToolTip("View Bookmarks")
@@ -149,6 +393,13 @@ class GKM_Browser(QMainWindow):
         screenshot_btn.setToolTip("Capture Screenshot")
         screenshot_btn.triggered.connect(self.capture_screenshot)
         self.navbar.addAction(screenshot_btn)
+        self.page_controls.append(screenshot_btn)
+
+        full_screenshot_btn = QAction("🖼", self)
+        full_screenshot_btn.setToolTip("Capture Full-Page Screenshot")
+        full_screenshot_btn.triggered.connect(self.capture_full_page)
+        self.navbar.addAction(full_screenshot_btn)
+        self.page_controls.append(full_screenshot_btn)
 
         # Ad blocker
         adblock_btn = QAction("🛑", self)
@@ -179,11 +430,50 @@ class GKM_Browser(QMainWindow):
         save_page_action = QAction("Save Page As...", self)
         save_page_action.triggered.connect(self.save_page)
         file_menu.addAction(save_page_action)
+        self.page_controls.append(save_page_action)
         
+        page_text_action = QAction("Index Page Text for History Search", self)
+        page_text_action.setCheckable(True)
+        page_text_action.setChecked(self.fulltext is not None)
+        page_text_action.toggled.connect(self.toggle_page_text_index)
+        file_menu.addAction(page_text_action)
+
+        import_bookmarks_action = QAction("Import Bookmarks...", self)
+        import_bookmarks_action.triggered.connect(self.import_bookmarks)
+        file_menu.addAction(import_bookmarks_action)
+
+        export_bookmarks_action = QAction("Export Bookmarks...", self)
+        export_bookmarks_action.triggered.connect(self.export_bookmarks)
+        file_menu.addAction(export_bookmarks_action)
+
         clear_history_action = QAction("Clear History", self)
         clear_history_action.triggered.connect(self.clear_history)
         file_menu.addAction(clear_history_action)
         
+        diagnostics_action = QAction("Page Load Diagnostics", self)
+        diagnostics_action.triggered.connect(self.show_diagnostics)
+        file_menu.addAction(diagnostics_action)
+
+        site_dark_mode_action = QAction("Toggle Dark Mode for This Site", self)
+        site_dark_mode_action.triggered.connect(self.toggle_site_dark_mode)
+        file_menu.addAction(site_dark_mode_action)
+        self.page_controls.append(site_dark_mode_action)
+
+        lite_mode_action = QAction("Lite Mode", self)
+        lite_mode_action.setCheckable(True)
+        lite_mode_action.setChecked(self.site_settings.lite_mode)
+        lite_mode_action.toggled.connect(self.site_settings.set_lite_mode)
+        file_menu.addAction(lite_mode_action)
+
+        site_settings_action = QAction("Settings for This Site...", self)
+        site_settings_action.triggered.connect(self.show_site_settings)
+        file_menu.addAction(site_settings_action)
+        self.page_controls.append(site_settings_action)
+
+        tab_usage_action = QAction("Tab Memory Usage", self)
+        tab_usage_action.triggered.connect(self.show_tab_usage)
+        file_menu.addAction(tab_usage_action)
+
         set_homepage_action = QAction("Set Homepage", self)
         set_homepage_action.triggered.connect(self.set_homepage)
         file_menu.addAction(set_homepage_action)
@@ -193,31 +483,110 @@ class GKM_Browser(QMainWindow):
         file_menu.addAction(exit_action)
 
     def current_browser(self):
+        # None until the first tab is open
         return self.tab_widget.currentWidget()
 
+    def open_url(self, url):
+        # In the current tab, or a new one if there is none yet
+        browser = self.current_browser()
+        if browser is None:
+            self.add_new_tab(url, "New Tab")
+        else:
+            browser.setUrl(url)
+
     def add_new_tab(self, url, title):
+        browser = self.create_browser(url)
+        index = self.tab_widget.addTab(browser, title)
+        self.tab_widget.setCurrentIndex(index)
+        self.session_timer.start()
+
+    def create_browser(self, url, zoom=1.0, scroll=None):
         browser = QWebEngineView()
-        profile = QWebEngineProfile("incognito" if self.incognito_mode else "default", browser)
-        page = QWebEnginePage(profile, browser)
+        page = SitePage(self.profiles.profile(self.incognito_mode), self.site_settings, browser)
         browser.setPage(page)
+        page.navigation_starting.connect(lambda url: self.user_scripts.apply_site_filter(page, url))
+        self.page_metrics.attach(browser)
         browser.setUrl(url)
-        
-        index = self.tab_widget.addTab(browser, title)
-        self.tab_widget.setCurrentIndex(index)
-        
+        self.lifecycle.track(browser)
+
+        browser.loadFinished.connect(lambda ok: trace.mark("first_load_finished"))
         browser.urlChanged.connect(lambda q: self.update_url(q, browser))
         browser.titleChanged.connect(lambda title: self.tab_widget.setTabText(self.tab_widget.indexOf(browser), title[:20]))
         if not self.incognito_mode:
             browser.urlChanged.connect(self.update_history)
-        profile.downloadRequested.connect(self.handle_download)
-        
+            browser.loadFinished.connect(lambda ok: self.index_page_text(browser, ok))
+            browser.urlChanged.connect(self.session_timer.start)
+            browser.titleChanged.connect(self.session_timer.start)
+            page.scrollPositionChanged.connect(self.session_timer.start)
+
+        if zoom != 1.0 or scroll:
+            # Zoom and scroll only stick once the page has loaded
+            def restore_view(ok):
+                browser.loadFinished.disconnect(restore_view)
+                browser.setZoomFactor(zoom)
+                if scroll:
+                    page.runJavaScript(f"window.scrollTo({float(scroll[0])}, {float(scroll[1])})")
+            browser.loadFinished.connect(restore_view)
+
         # Context menu
         browser.setContextMenuPolicy(Qt.CustomContextMenu)
         browser.customContextMenuRequested.connect(lambda pos: self.show_context_menu(pos, browser))
-        
-        # Apply ad blocker if enabled
-        if self.ad_block_enabled:
-            self.apply_ad_block(browser)
+        return browser
+
+    def restore_session(self, session):
+        # Restored tabs go after any that are already open
+        current = self.tab_widget.count() + session["current"]
+        self._restoring_session = True
+        for state in session["tabs"]:
+            self.tab_widget.addTab(TabPlaceholder(state), (state.get("title") or "New Tab")[:20])
+        self.tab_widget.setCurrentIndex(current)
+        self._restoring_session = False
+        self.restore_placeholder(current)
+
+    def restore_placeholder(self, index):
+        # Swap a restored tab's placeholder for a real view the first time it is selected
+        placeholder = self.tab_widget.widget(index)
+        if self._restoring_session or not isinstance(placeholder, TabPlaceholder):
+            return
+        state = placeholder.state
+        browser = self.create_browser(QUrl(state["url"]), state.get("zoom", 1.0), state.get("scroll"))
+        self._restoring_session = True
+        self.tab_widget.insertTab(index, browser, (state.get("title") or "New Tab")[:20])
+        self.tab_widget.setCurrentIndex(index)
+        self.tab_widget.removeTab(index + 1)
+        self._restoring_session = False
+        placeholder.deleteLater()
+        self.lifecycle.activate(browser)
+
+    def save_session(self):
+        self.session_timer.stop()
+        tabs = []
+        current = 0
+        for i in range(self.tab_widget.count()):
+            widget = self.tab_widget.widget(i)
+            if isinstance(widget, TabPlaceholder):
+                state = widget.state
+            elif widget.page().profile().isOffTheRecord():
+                continue
+            else:
+                position = widget.page().scrollPosition()
+                state = {
+                    "url": widget.url().toString(),
+                    "title": widget.title(),
+                    "zoom": widget.zoomFactor(),
+                    "scroll": [position.x(), position.y()],
+                }
+            if i == self.tab_widget.currentIndex():
+                current = len(tabs)
+            tabs.append(state)
+        save_session(self.io, tabs, current)
+
+    def setup_profile(self, profile):
+        # Called once for each shared profile when it is first created
+        profile.downloadRequested.connect(self.handle_download)
+        profile.setUrlRequestInterceptor(self.ad_blocker)
+        self.page_metrics.install(profile)
+        self.user_scripts.install(profile)
 
     def show_context_menu(self, pos, browser):
         menu = QMenu()
@@ -233,7 +602,13 @@ class GKM_Browser(QMainWindow):
 
     def close_tab(self, index):
         if self.tab_widget.count() > 1:
+            browser = self.tab_widget.widget(index)
             self.tab_widget.removeTab(index)
+            if not isinstance(browser, TabPlaceholder):
+                self.lifecycle.untrack(browser)
+                self.page_metrics.detach(browser)
+            browser.deleteLater()
+            self.session_timer.start()
         else:
             QMessageBox.warning(self, "Warning", "Cannot close the last tab!")
 
@@ -246,11 +621,66 @@ class GKM_Browser(QMainWindow):
         if text.startswith(("http://", "https://")) or "." in text:
             if not text.startswith(("http://", "https://")):
                 text = "https://" + text
-            self.current_browser().setUrl(QUrl(text))
+            self.open_url(QUrl(text))
         else:
             # Perform search with selected search engine
             search_url = self.search_engine.format(text.replace(" ", "+"))
-            self.current_browser().setUrl(QUrl(search_url))
+            self.open_url(QUrl(search_url))
+
+    def update_url_suggestions(self, text):
+        suggestions = [url for url, _ in self.omnibox.search(text)]
+        self.url_completer_model.setStringList(suggestions)
+
+    def open_suggestion(self, url):
+        self.url_bar.setText(url)
+        self.open_url(QUrl(url))
+
+    def build_omnibox_index(self):
+        self._omnibox_started = time.perf_counter()
+        self._omnibox_visits = []
+        # The startup trace waits for the index too
+        trace.expect("omnibox_ready")
+        # Taken here, on the GUI thread, so it splits visits exactly into
+        # those it holds and those update_history records from now on
+        snapshot = self.history.snapshot()
+        threading.Thread(target=self._build_omnibox, args=(snapshot, self._omnibox_generation),
+                         name="omnibox-build", daemon=True).start()
+        return False
+
+    def _build_omnibox(self, snapshot, generation):
+        # Worker thread; the index is not shared until it is complete
+        index = OmniboxIndex()
+        batch = []
+        for url, _, frecency in snapshot:
+            batch.append((url, frecency))
+            if len(batch) >= OMNIBOX_BUILD_CHUNK:
+                index.add_pages(batch)
+                batch = []
+        index.add_pages(batch)
+        try:
+            self.omnibox_built.emit(generation, index)
+        except RuntimeError:
+            # The window was closed meanwhile
+            pass
+
+    def on_omnibox_built(self, generation, index):
+        if generation != self._omnibox_generation:
+            return
+        for url, when in self._omnibox_visits:
+            index.add_visit(url, when)
+        self._omnibox_visits = None
+        self.omnibox = index
+        self.index_bookmarks()
+        trace.record("omnibox_index", self._omnibox_started, time.perf_counter())
+        trace.mark("omnibox_ready")
+
+    def index_bookmarks(self):
+        with trace.span("bookmark_index"):
+            for bookmark in self.bookmarks:
+                self.index_bookmark(bookmark)
+
+    def index_bookmark(self, bookmark):
+        self.omnibox.add_bookmark(bookmark.url, bookmark.name, bookmark.added)
 
     def change_search_engine(self, engine_name):
         self.search_engine = SEARCH_ENGINES[engine_name]
@@ -267,87 +697,201 @@ class GKM_Browser(QMainWindow):
     def update_history(self, q):
         if not self.incognito_mode:
             url = q.toString()
-            timestamp = datetime.datetime.now().isoformat()
-            self.history.append({"url": url, "timestamp": timestamp})
-            self.save_history()
+            now = time.time()
+            # Queued for the background writer, which batches the disk
+            # writes; history keeps the URL as visited for navigation
+            self.history.append(url, now)
+            # Before build_omnibox_index takes its history snapshot, the
+            # visit reaches the omnibox through that; adding it here too
+            # would count it twice. Later visits are not in the snapshot.
+            if self._omnibox_started is not None:
+                # Keyed like history, so variants of a page share one entry
+                key = normalize_url(url)
+                self.omnibox.add_visit(key, now)
+                if self._omnibox_visits is not None:
+                    self._omnibox_visits.append((key, now))
+
+    def open_fulltext_index(self):
+        return FullTextIndex(
+            self.settings.get("page_text_index_dir", INDEX_DIR),
+            self.settings.get("page_text_max_docs", MAX_DOCS),
+            self.settings.get("page_text_max_age_days", MAX_AGE_DAYS),
+            self.settings.get("page_text_max_mb", MAX_BYTES // (1024 * 1024)) * 1024 * 1024,
+        )
+
+    def toggle_page_text_index(self, enabled):
+        self.settings["index_page_text"] = enabled
+        self.save_settings()
+        if enabled and self.fulltext is None:
+            self.fulltext = self.open_fulltext_index()
+        elif not enabled and self.fulltext is not None:
+            self.fulltext.close()
+            self.fulltext = None
+
+    def index_page_text(self, browser, ok):
+        # The text is handed to the index's worker thread for tokenizing
+        if not ok or self.fulltext is None or browser.page().profile().isOffTheRecord():
+            return
+        url = browser.url().toString()
+        if not url.startswith(("http://", "https://")):
+            return
+        title = browser.title()
+        fulltext = self.fulltext
+        browser.page().toPlainText(lambda text: fulltext.add(url, title, text))
 
     def update_navigation_buttons(self, index):
-        pass
+        for control in self.page_controls:
+            control.setEnabled(index >= 0)
 
     def load_bookmarks(self):
-        if os.path.exists(BOOKMARK_FILE):
-            try:
-                with open(BOOKMARK_FILE, 'r') as f:
-                    content = f.read().strip()
-                    if content:
-                        return json.loads(content)
-                    return []
-            except (json.JSONDecodeError, IOError):
-                return []
-        return []
+        # Files written by older versions are migrated on load
+        return BookmarkStore(BOOKMARK_FILE)
 
     def save_bookmarks(self):
-        try:
-            with open(BOOKMARK_FILE, 'w') as f:
-                json.dump(self.bookmarks, f)
-        except IOError:
-            QMessageBox.warning(self, "Error", "Failed to save bookmarks.")
+        self.io.write_json(BOOKMARK_FILE, self.bookmarks.to_json(), "bookmarks")
 
     def add_bookmark(self):
         current_url = self.current_browser().url().toString()
-        if current_url and not any(b["url"] == current_url for b in self.bookmarks):
-            name, ok = QInputDialog.getText(self, "Bookmark Name", "Enter name for bookmark:", text=current_url)
-            if ok and name:
-                self.bookmarks.append({"name": name, "url": current_url})
+        if not current_url or current_url in self.bookmarks:
+            return
+        dialog = QWidget(self, Qt.Window)
+        dialog.setWindowTitle("Add Bookmark")
+        layout = QVBoxLayout()
+        name_box = QLineEdit(self.current_browser().title() or current_url)
+        name_box.setPlaceholderText("Name")
+        layout.addWidget(name_box)
+        folder_box = QComboBox()
+        folder_box.setEditable(True)
+        folder_box.addItems([""] + self.bookmarks.folders())
+        folder_box.lineEdit().setPlaceholderText("Folder, e.g. Work/Docs (optional)")
+        layout.addWidget(folder_box)
+        tags_box = QLineEdit()
+        tags_box.setPlaceholderText("Tags, comma separated (optional)")
+        layout.addWidget(tags_box)
+
+        def save():
+            name = name_box.text().strip()
+            if not name:
+                return
+            tags = [t.strip() for t in tags_box.text().split(",") if t.strip()]
+            bookmark = self.bookmarks.add(current_url, name, folder_box.currentText().strip(), tags)
+            dialog.close()
+            if bookmark is not None:
+                self.index_bookmark(bookmark)
                 self.save_bookmarks()
                 QMessageBox.information(self, "Bookmark Added", f"Bookmarked: {name}")
+        save_btn = QPushButton("Save")
+        save_btn.clicked.connect(save)
+        name_box.returnPressed.connect(save)
+        layout.addWidget(save_btn)
+        dialog.setLayout(layout)
+        dialog.show()
+
+    def import_bookmarks(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Bookmarks", "", "Bookmarks HTML (*.html *.htm);;All Files (*)")
+        if not path or self._bookmark_import is not None:
+            return
+        # Imported in slices between events, so large files don't freeze the window
+        self._bookmark_import = self.bookmarks.import_html(path)
+        self._bookmark_import_count = 0
+        self.statusBar().showMessage("Importing bookmarks...")
+        QTimer.singleShot(0, self.continue_bookmark_import)
+
+    def continue_bookmark_import(self):
+        try:
+            for _ in range(BOOKMARK_IMPORT_CHUNK):
+                self.index_bookmark(next(self._bookmark_import))
+                self._bookmark_import_count += 1
+        except StopIteration:
+            pass
+        except (IOError, UnicodeError) as e:
+            self.statusBar().clearMessage()
+            QMessageBox.warning(self, "Error", f"Failed to import bookmarks: {e}")
+        else:
+            self.statusBar().showMessage(f"Importing bookmarks... {self._bookmark_import_count}")
+            QTimer.singleShot(0, self.continue_bookmark_import)
+            return
+        self._bookmark_import = None
+        self.save_bookmarks()
+        self.statusBar().clearMessage()
+        QMessageBox.information(self, "Bookmarks Imported", f"Imported {self._bookmark_import_count} new bookmarks.")
+
+    def export_bookmarks(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Bookmarks", "bookmarks.html", "Bookmarks HTML (*.html)")
+        if not path:
+            return
+        try:
+            count = self.bookmarks.export_html(path)
+        except IOError as e:
+            QMessageBox.warning(self, "Error", f"Failed to export bookmarks: {e}")
+            return
+        QMessageBox.information(self, "Bookmarks Exported", f"Exported {count} bookmarks to: {path}")
 
     def show_bookmarks(self):
-        dialog = QWidget(self)
-        dialog.setWindowTitle("Bookmarks")
+        dialog = self.create_list_dialog("Bookmarks", BookmarkModel(self.bookmarks))
+        dialog.resize(400, 300)
+        dialog.show()
+
+    def create_list_dialog(self, title, model, alternate=None):
+        # Shared by the history and bookmark viewers: the view only asks the
+        # model for visible rows, and the model pages more in as it scrolls.
+        dialog = QWidget(self, Qt.Window)
+        dialog.setWindowTitle(title)
+        model.setParent(dialog)
         layout = QVBoxLayout()
-        list_widget = QListWidget()
-        for bookmark in self.bookmarks:
-            list_widget.addItem(bookmark["name"])
-        list_widget.itemDoubleClicked.connect(
-            lambda item: self.current_browser().setUrl(QUrl(self.bookmarks[list_widget.row(item)]["url"]))
+
+        filter_box = QLineEdit()
+        filter_box.setPlaceholderText("Filter...")
+        filter_box.setClearButtonEnabled(True)
+        filter_timer = QTimer(dialog)
+        filter_timer.setSingleShot(True)
+        filter_timer.setInterval(200)
+        filter_box.textChanged.connect(filter_timer.start)
+        layout.addWidget(filter_box)
+
+        list_view = QListView()
+        list_view.setUniformItemSizes(True)
+        list_view.setModel(model)
+        list_view.doubleClicked.connect(
+            lambda index: self.open_url(QUrl(index.data(URL_ROLE)))
         )
-        layout.addWidget(list_widget)
+        filter_timer.timeout.connect(lambda: list_view.model().set_filter(filter_box.text()))
+
+        # alternate is (label, model): a checkbox switches the view over to it
+        if alternate is not None:
+            label, alternate_model = alternate
+            alternate_model.setParent(dialog)
+            switch = QCheckBox(label)
+
+            def switch_model(checked):
+                list_view.setModel(alternate_model if checked else model)
+                list_view.model().set_filter(filter_box.text())
+            switch.toggled.connect(switch_model)
+            layout.addWidget(switch)
+
+        layout.addWidget(list_view)
         dialog.setLayout(layout)
-        dialog.resize(400, 300)
-        dialog.show()
+        return dialog
 
     def load_history(self):
-        if os.path.exists(HISTORY_FILE):
-            try:
-                with open(HISTORY_FILE, 'r') as f:
-                    content = f.read().strip()
-                    if content:
-                        return json.loads(content)
-                    return []
-            except (json.JSONDecodeError, IOError):
-                return []
-        return []
+        # Opens the history database without reading any rows; an existing
+        # history.json is imported into it the first time.
+        try:
+            return HistoryStore(HISTORY_DB, legacy_json=HISTORY_FILE,
+                                max_age_days=self.settings.get("history_max_age_days", HISTORY_MAX_AGE_DAYS),
+                                max_pages=self.settings.get("history_max_pages", HISTORY_MAX_PAGES))
+        except sqlite3.Error:
+            QMessageBox.warning(self, "Error", "Failed to open history, using a temporary one.")
+            return HistoryStore(":memory:")
 
     def save_history(self):
-        try:
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(self.history, f)
-        except IOError:
-            QMessageBox.warning(self, "Error", "Failed to save history.")
+        self.history.request_flush()
 
     def show_history(self):
-        dialog = QWidget(self)
-        dialog.setWindowTitle("History")
-        layout = QVBoxLayout()
-        list_widget = QListWidget()
-        for entry in reversed(self.history):
-            list_widget.addItem(f"{entry['timestamp']} - {entry['url']}")
-        list_widget.itemDoubleClicked.connect(
-            lambda item: self.current_browser().setUrl(QUrl(self.history[len(self.history) - 1 - list_widget.row(item)]['url']))
-        )
-        layout.addWidget(list_widget)
-        dialog.setLayout(layout)
+        alternate = None
+        if self.fulltext is not None:
+            alternate = ("Search page text", PageTextModel(self.fulltext))
+        dialog = self.create_list_dialog("History", HistoryModel(self.history), alternate)
         dialog.resize(600, 400)
         dialog.show()
 
@@ -355,8 +899,14 @@ class GKM_Browser(QMainWindow):
         reply = QMessageBox.question(self, "Clear History", "Are you sure you want to clear your browsing history?",
                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            self.history = []
+            self.history.clear()
             self.save_history()
+            self._omnibox_generation += 1
+            self._omnibox_visits = None
+            self.omnibox.clear()
+            self.index_bookmarks()
+            if self.fulltext is not None:
+                self.fulltext.clear()
             QMessageBox.information(self, "History Cleared", "Browsing history has been cleared.")
 
     def load_settings(self):
@@ -372,11 +922,122 @@ class GKM_Browser(QMainWindow):
         return {}
 
     def save_settings(self):
-        try:
-            with open(SETTINGS_FILE, 'w') as f:
-                json.dump(self.settings, f)
-        except IOError:
-            QMessageBox.warning(self, "Error", "Failed to save settings.")
+        self.io.write_json(SETTINGS_FILE, self.settings, "settings")
+
+    def on_io_saved(self, tag, path):
+        if tag == "remote":
+            self._remote_captures.pop(path)({"ok": True, "path": path})
+        elif tag == "page":
+            QMessageBox.information(self, "Success", "Page saved successfully!")
+        elif tag == "screenshot":
+            QMessageBox.information(self, "Success", f"Screenshot saved to: {path}")
+
+    def on_io_failed(self, tag, path, message):
+        if tag == "remote":
+            self._remote_captures.pop(path)({"ok": False, "error": message})
+            return
+        if tag == "session":
+            return
+        QMessageBox.warning(self, "Error", f"Failed to save {tag}: {message}")
+
+    # Commands from later launches and scripts, see instance.py
+
+    def remote_handlers(self):
+        return {"open": self.remote_open, "list-tabs": self.remote_list_tabs, "capture": self.remote_capture}
+
+    def remote_open(self, request, reply):
+        urls = [u for u in request.get("urls", []) if isinstance(u, str) and u.strip()]
+        self.open_urls(urls or [self.homepage])
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        reply({"ok": True, "opened": max(1, len(urls))})
+
+    def remote_list_tabs(self, request, reply):
+        tabs = []
+        for i in range(self.tab_widget.count()):
+            widget = self.tab_widget.widget(i)
+            if isinstance(widget, TabPlaceholder):
+                tab = {"url": widget.state["url"], "title": widget.state.get("title", ""), "loaded": False}
+            else:
+                tab = {"url": widget.url().toString(), "title": widget.title(), "loaded": True,
+                       "incognito": widget.page().profile().isOffTheRecord()}
+            tab.update(index=i, current=i == self.tab_widget.currentIndex())
+            tabs.append(tab)
+        reply({"ok": True, "tabs": tabs})
+
+    def remote_capture(self, request, reply):
+        index = request.get("tab")
+        widget = self.tab_widget.widget(self.tab_widget.currentIndex() if index is None else index)
+        if widget is None or isinstance(widget, TabPlaceholder):
+            reply({"ok": False, "error": "no such tab, or the tab has not been loaded yet"})
+            return
+        path = request["path"]
+        fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        fmt = {"jpeg": "jpg"}.get(fmt, fmt)
+        if fmt not in IMAGE_FORMATS:
+            reply({"ok": False, "error": "path must end in .png, .jpg or .webp"})
+            return
+        scale = float(request.get("scale") or 1.0)
+        if request.get("full_page"):
+            capture = FullPageCapture(widget, path, fmt, scale, parent=self)
+
+            def captured(ok, report):
+                capture.deleteLater()
+                reply(dict(report, ok=ok))
+            capture.finished.connect(captured)
+            capture.start()
+            return
+        if path in self._remote_captures:
+            reply({"ok": False, "error": "a capture to this path is already running"})
+            return
+        image = widget.grab().toImage()
+        if scale != 1.0:
+            image = image.scaledToWidth(max(1, round(image.width() * scale)), Qt.SmoothTransformation)
+        self._remote_captures[path] = reply
+        self.io.write_image(path, image, IMAGE_FORMATS[fmt], tag="remote")
+
+    def show_tab_usage(self):
+        stats = self.lifecycle.stats()
+        QMessageBox.information(
+            self, "Tab Memory Usage",
+            f"Active: {stats['active']}\nFrozen: {stats['frozen']}\nDiscarded: {stats['discarded']}\n"
+            f"Live renderer memory: {stats['live_bytes'] / 1048576:.1f} MB\n"
+            f"Reclaimed by {stats['discards']} discards: {stats['reclaimed_bytes'] / 1048576:.1f} MB"
+        )
+
+    def show_diagnostics(self):
+        dialog = QWidget(self, Qt.Window)
+        dialog.setWindowTitle("Page Load Diagnostics")
+        layout = QVBoxLayout()
+        headers = ["Host", "Loads", "Failed", "Memory (MB)"]
+        for name in SUMMARY_METRICS:
+            label = name[:-3].replace("_", " ")
+            headers += [f"{label} p50 (ms)", f"{label} p95 (ms)"]
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.verticalHeader().hide()
+
+        def refresh():
+            rows = self.page_metrics.summary()
+            table.setRowCount(len(rows))
+            for i, row in enumerate(rows):
+                values = [row["host"], row["loads"], row["failures"], f"{row['memory_bytes'] / 1048576:.0f}"]
+                for name in SUMMARY_METRICS:
+                    values += [row[f"{name}_p50"], row[f"{name}_p95"]]
+                for column, value in enumerate(values):
+                    table.setItem(i, column, QTableWidgetItem("" if value is None else str(value)))
+            table.resizeColumnsToContents()
+
+        refresh()
+        layout.addWidget(table)
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(refresh)
+        layout.addWidget(refresh_btn)
+        dialog.setLayout(layout)
+        dialog.resize(800, 400)
+        dialog.show()
 
     def set_homepage(self):
         url, ok = QInputDialog.getText(self, "Set Homepage", "Enter homepage URL:", text=self.homepage)
@@ -389,18 +1050,26 @@ class GKM_Browser(QMainWindow):
             QMessageBox.information(self, "Homepage Set", f"Homepage set to: {url}")
 
     def show_downloads(self):
-        dialog = QWidget(self)
+        dialog = QWidget(self, Qt.Window)
         dialog.setWindowTitle("Downloads")
         layout = QVBoxLayout()
-        list_widget = QListWidget()
-        if not DOWNLOADS:
-            list_widget.addItem("No downloads yet")
-        else:
-            for download in DOWNLOADS:
-                list_widget.addItem(f"{download['path']} - {download['status']}")
-        layout.addWidget(list_widget)
+        table = QTableView()
+        table.setModel(self.downloads)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
+        table.verticalHeader().hide()
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(table)
+
+        buttons = QHBoxLayout()
+        for label, action in (("Pause", self.downloads.pause), ("Resume", self.downloads.resume),
+                              ("Cancel", self.downloads.cancel)):
+            button = QPushButton(label)
+            button.clicked.connect(lambda _, action=action: action(table.currentIndex().row()))
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
         dialog.setLayout(layout)
-        dialog.resize(400, 300)
+        dialog.resize(600, 300)
         dialog.show()
 
     def handle_download(self, download):
@@ -408,23 +1077,8 @@ class GKM_Browser(QMainWindow):
         path, _ = QFileDialog.getSaveFileName(self, "Save File", suggested_path)
         if path:
             download.setPath(path)
-            download.accept()
-            DOWNLOADS.append({"path": path, "status": "In Progress"})
-            download.finished.connect(lambda: self.update_download_status(path, "Completed"))
-            download.downloadProgress.connect(lambda received, total: self.update_download_progress(path, received, total))
-            QMessageBox.information(self, "Download", f"Downloading to: {path}")
-
-    def update_download_status(self, path, status):
-        for download in DOWNLOADS:
-            if download["path"] == path:
-                download["status"] = status
-                break
-
-    def update_download_progress(self, path, received, total):
-        for download in DOWNLOADS:
-            if download["path"] == path:
-                download["status"] = f"Progress: {received}/{total} bytes"
-                break
+            self.downloads.add(download, path)
+            self.statusBar().showMessage(f"Downloading to: {path}", 3000)
 
     def save_page(self):
         path, _ = QFileDialog.getSaveFileName(self, "Save Page", "", "Web Page (*.html);;All Files (*)")
@@ -432,36 +1086,65 @@ class GKM_Browser(QMainWindow):
             self.current_browser().page().toHtml(lambda html: self.save_html(path, html))
 
     def save_html(self, path, html):
-        try:
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(html)
-            QMessageBox.information(self, "Success", "Page saved successfully!")
-        except IOError:
-            QMessageBox.warning(self, "Error", "Failed to save page.")
+        self.io.write_text(path, html, "page")
 
     def capture_screenshot(self):
         path, _ = QFileDialog.getSaveFileName(self, "Save Screenshot", "", "PNG Image (*.png);;All Files (*)")
         if path:
-            self.current_browser().grab().save(path, "PNG")
-            QMessageBox.information(self, "Success", f"Screenshot saved to: {path}")
+            # Only the grab happens here; PNG encoding runs on the I/O pool
+            self.io.write_image(path, self.current_browser().grab().toImage(), "PNG", tag="screenshot")
+
+    def capture_full_page(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Full-Page Screenshot", "",
+                                              "PNG Image (*.png);;JPEG Image (*.jpg);;WebP Image (*.webp)")
+        if not path:
+            return
+        fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        fmt = {"jpeg": "jpg"}.get(fmt, fmt)
+        if fmt not in IMAGE_FORMATS:
+            fmt = "png"
+            path += ".png"
+        # Tiles are scrolled, grabbed and encoded one at a time
+        capture = FullPageCapture(self.current_browser(), path, fmt,
+                                  self.settings.get("screenshot_scale", 1.0),
+                                  self.settings.get("screenshot_quality", -1), parent=self)
+        capture.finished.connect(lambda ok, report: self.full_page_captured(capture, ok, report))
+        self.statusBar().showMessage("Capturing full page...")
+        capture.start()
+
+    def full_page_captured(self, capture, ok, report):
+        capture.deleteLater()
+        self.statusBar().clearMessage()
+        if not ok:
+            QMessageBox.warning(self, "Error", f"Failed to capture page: {report['error']}")
+            return
+        note = "\n(Page was cut off at the maximum height.)" if report["truncated"] else ""
+        QMessageBox.information(
+            self, "Success",
+            f"Screenshot saved to: {report['path']}\n"
+            f"{report['width']} x {report['height']} px in {report['tiles']} tiles, scale {report['scale']}\n"
+            f"Total {report['total_ms']:.0f} ms: waiting for paint {report['settle_ms']:.0f} ms, "
+            f"grabbing {report['grab_ms']:.0f} ms, encoding {report['encode_ms']:.0f} ms{note}"
+        )
 
     def toggle_ad_block(self):
+        # Requests are filtered by the interceptor, so this applies to every
+        # tab immediately, including requests made after the page loaded
         self.ad_block_enabled = not self.ad_block_enabled
-        for i in range(self.tab_widget.count()):
-            browser = self.tab_widget.widget(i)
-            self.apply_ad_block(browser)
+        self.ad_blocker.enabled = self.ad_block_enabled
+        # Element hiding is only needed for what slips through the network filter
+        if self.ad_blocker.engine is not None:
+            self.user_scripts.set_cosmetic_filter(self.ad_blocker.engine if self.ad_block_enabled else None)
+            for i in range(self.tab_widget.count()):
+                browser = self.tab_widget.widget(i)
+                if not isinstance(browser, TabPlaceholder):
+                    page = browser.page()
+                    self.user_scripts.apply_site_filter(page, page.url())
+                    page.runJavaScript(self.user_scripts.cosmetic_update_js(page.url().host()),
+                                       QWebEngineScript.ApplicationWorld)
         status = "enabled" if self.ad_block_enabled else "disabled"
         QMessageBox.information(self, "Ad Blocker", f"Ad blocker {status}!")
 
-    def apply_ad_block(self, browser):
-        ad_block_script = """
-        (function() {
-            var ads = document.querySelectorAll('[id*="ad"], [class*="ad"], [id*="banner"], [class*="banner"]');
-            ads.forEach(ad => ad.style.display = 'none');
-        })();
-        """ if self.ad_block_enabled else ""
-        browser.page().runJavaScript(ad_block_script)
-
     def find_in_page(self):
         text = self.find_bar.text().strip()
         if text:
@@ -473,8 +1156,75 @@ class GKM_Browser(QMainWindow):
 
     def toggle_dark_mode(self):
         self.dark_mode_enabled = not self.dark_mode_enabled
-        script = "document.body.style.filter = 'invert(1) hue-rotate(180deg)'" if self.dark_mode_enabled else "document.body.style.filter = ''"
-        self.current_browser().page().runJavaScript(script)
+        self.settings["dark_mode"] = self.dark_mode_enabled
+        self.save_settings()
+        self.update_dark_mode()
+
+    def toggle_site_dark_mode(self):
+        # Per-site opt-out, for sites that already have a dark theme
+        host = self.current_browser().url().host()
+        if not host:
+            return
+        exclusions = self.settings.setdefault("dark_mode_exclusions", [])
+        if host in exclusions:
+            exclusions.remove(host)
+        else:
+            exclusions.append(host)
+        self.save_settings()
+        self.update_dark_mode()
+
+    def update_dark_mode(self):
+        self.user_scripts.set_dark_mode(self.dark_mode_enabled, self.settings.get("dark_mode_exclusions", []),
+                                        self.settings.get("dark_mode_site_css", {}))
+        self.run_in_all_tabs(self.user_scripts.dark_mode_update_js())
+
+    def show_site_settings(self):
+        host = self.current_browser().url().host()
+        if not host:
+            return
+        dialog = QWidget(self, Qt.Window)
+        dialog.setWindowTitle(f"Settings for {host}")
+        layout = QVBoxLayout()
+        rule = self.site_settings.rule(host)
+        effective = self.site_settings.for_host(host)
+        # A partially checked box follows lite mode and the defaults
+        boxes = {}
+        for name in SETTING_NAMES:
+            box = QCheckBox(SETTING_LABELS[name])
+            box.setTristate(True)
+            if name in rule:
+                box.setCheckState(Qt.Checked if rule[name] else Qt.Unchecked)
+            else:
+                box.setCheckState(Qt.PartiallyChecked)
+                box.setToolTip(f"Default: {'on' if effective[name] else 'off'}")
+            layout.addWidget(box)
+            boxes[name] = box
+
+        def save():
+            self.site_settings.set_rule(host, {name: box.checkState() == Qt.Checked
+                                               for name, box in boxes.items()
+                                               if box.checkState() != Qt.PartiallyChecked})
+            dialog.close()
+        save_btn = QPushButton("Save")
+        save_btn.clicked.connect(save)
+        layout.addWidget(save_btn)
+        dialog.setLayout(layout)
+        dialog.show()
+
+    def site_settings_changed(self):
+        self.io.write_json(self.site_settings.path, self.site_settings.to_json(), "site settings")
+        # Open tabs reload only if their settings actually changed
+        for i in range(self.tab_widget.count()):
+            browser = self.tab_widget.widget(i)
+            if not isinstance(browser, TabPlaceholder) and self.site_settings.apply(browser.page(), browser.url()):
+                browser.reload()
+
+    def run_in_all_tabs(self, script):
+        # Restored tabs that were never opened pick up the change when they load
+        for i in range(self.tab_widget.count()):
+            browser = self.tab_widget.widget(i)
+            if not isinstance(browser, TabPlaceholder):
+                browser.page().runJavaScript(script, QWebEngineScript.ApplicationWorld)
 
     def toggle_incognito_mode(self):
         self.incognito_mode = not self.incognito_mode
@@ -485,17 +1235,77 @@ class GKM_Browser(QMainWindow):
     def zoom_in(self):
         current_zoom = self.current_browser().zoomFactor()
         self.current_browser().setZoomFactor(current_zoom + 0.1)
+        self.session_timer.start()
 
     def zoom_out(self):
         current_zoom = self.current_browser().zoomFactor()
         self.current_browser().setZoomFactor(max(0.1, current_zoom - 0.1))
+        self.session_timer.start()
 
     def zoom_reset(self):
         self.current_browser().setZoomFactor(1.0)
+        self.session_timer.start()
+
+    def closeEvent(self, event):
+        # Commit any visits still waiting in the history writer
+        self.save_session()
+        self.history.close()
+        self.ad_blocker.close()
+        if self.fulltext is not None:
+            self.fulltext.close()
+        # Let pending saves, including the session above, reach the disk
+        self.io.close()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    # URLs are not an argparse positional: it would also claim the values of
+    # Qt options such as "-platform offscreen", which parse_known_args passes on
+    parser = argparse.ArgumentParser(description="GKM Browser Pro", usage="%(prog)s [options] [URL ...]",
+                                     epilog="URLs are opened in the running browser if there is one; "
+                                            "put them after -- if one starts with a dash.")
+    parser.add_argument("--trace-startup", nargs="?", const="startup_trace.json", metavar="PATH",
+                        help="write a JSON startup trace (also enabled by GKM_STARTUP_TRACE=PATH)")
+    parser.add_argument("--fast-launch", action="store_true", default=None,
+                        help="show the window first and defer non-critical startup work")
+    parser.add_argument("--new-instance", action="store_true",
+                        help="start a separate browser even if one is already running")
+    capture = parser.add_argument_group("batch capture", "capture a list of URLs headlessly and exit")
+    capture.add_argument("--capture", metavar="URL_FILE", help="file with one URL per line")
+    capture.add_argument("--output-dir", default="captures", help="where captured pages are written")
+    capture.add_argument("--format", choices=sorted(FORMATS), default="html")
+    capture.add_argument("--workers", type=int, default=WORKERS, help="pages loaded concurrently")
+    capture.add_argument("--timeout", type=float, default=TIMEOUT_S, help="seconds allowed per page")
+    capture.add_argument("--retries", type=int, default=RETRIES)
+    capture.add_argument("--manifest", help="JSONL results file (default: OUTPUT_DIR/manifest.jsonl)")
+    capture.add_argument("--full-page", action="store_true", help="capture image formats as the whole page, in tiles")
+    capture.add_argument("--scale", type=float, default=1.0, help="downscale factor for image formats")
+    capture.add_argument("--quality", type=int, default=-1, help="JPEG/WebP quality, 0-100")
+    args, rest = parser.parse_known_args()
+    urls, qt_args = split_urls(rest)
+
+    if args.capture:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QApplication([sys.argv[0]] + qt_args)
+        batch = BatchCapture(read_url_file(args.capture), args.output_dir, args.format, args.workers,
+                             args.timeout, args.retries, args.manifest, args.full_page, args.scale, args.quality)
+        batch.finished.connect(lambda failures: app.exit(1 if failures else 0))
+        batch.start()
+        sys.exit(app.exec_())
+
+    trace_path = args.trace_startup or os.environ.get("GKM_STARTUP_TRACE")
+    if trace_path:
+        trace.enable(trace_path)
+
+    with trace.span("qapplication"):
+        app = QApplication([sys.argv[0]] + qt_args)
     QApplication.setApplicationName("GKM Browser Pro")
-    window = GKM_Browser()
-    window.show()
+    with trace.span("window_init"):
+        window = GKM_Browser(fast_launch=args.fast_launch)
+    with trace.span("window_show"):
+        window.show()
+    window.open_urls(urls)
+    if not args.new_instance:
+        # Later launches and scripts talk to this window from now on
+        server = InstanceServer(window.remote_handlers(), parent=window)
+        server.listen()
     sys.exit(app.exec_())
\ No newline at end of file
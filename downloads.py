@@ -0,0 +1,269 @@
+import datetime
+import json
+import os
+import time
+from collections import deque
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer
+
+DOWNLOADS_FILE = "downloads.jsonl"
+# Progress is pushed to the view at most this often, however many signals arrive
+REFRESH_INTERVAL_MS = 250
+MAX_CONCURRENT = 3
+# Completed records shown from earlier sessions
+HISTORY_LIMIT = 500
+# Weight of the newest sample in the smoothed speed
+SPEED_SMOOTHING = 0.3
+
+COLUMNS = ["File", "Status", "Progress", "Speed", "ETA"]
+
+
+def _format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+
+class DownloadEntry:
+    __slots__ = ("id", "item", "path", "url", "received", "total", "status",
+                 "speed", "started", "finished_at", "_last_bytes", "_last_time")
+
+    def __init__(self, entry_id, item, path, url, status):
+        self.id = entry_id
+        self.item = item
+        self.path = path
+        self.url = url
+        self.received = 0
+        self.total = -1
+        self.status = status
+        self.speed = 0.0
+        self.started = datetime.datetime.now().isoformat()
+        self.finished_at = None
+        self._last_bytes = 0
+        self._last_time = time.monotonic()
+
+    def record(self):
+        return {"path": self.path, "url": self.url, "status": self.status, "bytes": self.received,
+                "started": self.started, "finished": self.finished_at}
+
+
+class DownloadManager(QAbstractTableModel):
+    """Tracks downloads keyed by QWebEngineDownloadItem.id().
+
+    downloadProgress only stores the new byte counts and marks the entry
+    dirty; a timer turns dirty entries into one dataChanged per refresh, so
+    the view's cost doesn't grow with the signal rate. Downloads beyond
+    max_concurrent are accepted paused and resumed as others finish.
+    Finished downloads are appended to downloads.jsonl.
+    """
+
+    def __init__(self, settings, path=DOWNLOADS_FILE, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.max_concurrent = int(settings.get("max_concurrent_downloads", MAX_CONCURRENT))
+        self._entries = []
+        self._rows = {}
+        self._dirty = set()
+        self._waiting = deque()
+        self._load_records()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(REFRESH_INTERVAL_MS)
+        self._timer.timeout.connect(self.refresh)
+
+    def _load_records(self):
+        if not os.path.exists(self.path):
+            return
+        records = deque(maxlen=HISTORY_LIMIT)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except IOError:
+            return
+        for record in records:
+            entry = DownloadEntry(None, None, record.get("path", ""), record.get("url", ""),
+                                  record.get("status", "Completed"))
+            entry.received = entry.total = record.get("bytes", 0)
+            entry.started = record.get("started")
+            entry.finished_at = record.get("finished")
+            self._entries.append(entry)
+
+    # --- download lifecycle ---
+
+    def add(self, item, path):
+        # item is an accepted-to-be QWebEngineDownloadItem whose path has been chosen
+        entry = DownloadEntry(item.id(), item, path, item.url().toString(), "In Progress")
+        entry.total = item.totalBytes()
+        row = len(self._entries)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._entries.append(entry)
+        self._rows[entry.id] = row
+        self.endInsertRows()
+
+        item.downloadProgress.connect(lambda received, total: self.on_progress(entry.id, received, total))
+        item.finished.connect(lambda: self.on_finished(entry.id))
+        item.accept()
+        if self.active_count() > self.max_concurrent:
+            item.pause()
+            entry.status = "Queued"
+            self._waiting.append(entry.id)
+            self._dirty.add(entry.id)
+        if not self._timer.isActive():
+            self._timer.start()
+        return entry
+
+    def on_progress(self, entry_id, received, total):
+        row = self._rows.get(entry_id)
+        if row is None:
+            return
+        entry = self._entries[row]
+        entry.received = received
+        entry.total = total
+        self._dirty.add(entry_id)
+
+    def on_finished(self, entry_id):
+        row = self._rows.pop(entry_id, None)
+        if row is None:
+            return
+        entry = self._entries[row]
+        item = entry.item
+        if item.state() == item.DownloadCompleted:
+            entry.status = "Completed"
+            entry.received = item.receivedBytes()
+        elif item.state() == item.DownloadCancelled:
+            entry.status = "Cancelled"
+        else:
+            entry.status = "Failed"
+        entry.speed = 0.0
+        entry.finished_at = datetime.datetime.now().isoformat()
+        entry.item = None
+        self._dirty.discard(entry_id)
+        if entry_id in self._waiting:
+            self._waiting.remove(entry_id)
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, self.index(row, len(COLUMNS) - 1))
+        self._save_record(entry)
+        self._start_waiting()
+        if not self._rows:
+            self._timer.stop()
+
+    def _save_record(self, entry):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry.record()) + "\n")
+        except IOError:
+            pass
+
+    def active_count(self):
+        return sum(1 for row in self._rows.values() if self._entries[row].status == "In Progress")
+
+    def _start_waiting(self):
+        while self._waiting and self.active_count() < self.max_concurrent:
+            entry = self._entries[self._rows[self._waiting.popleft()]]
+            entry.item.resume()
+            entry.status = "In Progress"
+            self._dirty.add(entry.id)
+
+    # --- user actions, by model row ---
+
+    def _live_entry(self, row):
+        if 0 <= row < len(self._entries) and self._entries[row].item is not None:
+            return self._entries[row]
+        return None
+
+    def pause(self, row):
+        entry = self._live_entry(row)
+        if entry and entry.status == "In Progress":
+            entry.item.pause()
+            entry.status = "Paused"
+            self._dirty.add(entry.id)
+            self._start_waiting()
+
+    def resume(self, row):
+        entry = self._live_entry(row)
+        if entry and entry.status in ("Paused", "Queued"):
+            if entry.id in self._waiting:
+                self._waiting.remove(entry.id)
+            if self.active_count() >= self.max_concurrent:
+                entry.status = "Queued"
+                self._waiting.append(entry.id)
+            else:
+                entry.item.resume()
+                entry.status = "In Progress"
+            self._dirty.add(entry.id)
+
+    def cancel(self, row):
+        entry = self._live_entry(row)
+        if entry:
+            entry.item.cancel()
+
+    # --- periodic refresh ---
+
+    def refresh(self):
+        now = time.monotonic()
+        for entry_id in self._rows:
+            entry = self._entries[self._rows[entry_id]]
+            elapsed = now - entry._last_time
+            if elapsed <= 0:
+                continue
+            sample = (entry.received - entry._last_bytes) / elapsed
+            entry.speed = sample if entry.speed == 0 else SPEED_SMOOTHING * sample + (1 - SPEED_SMOOTHING) * entry.speed
+            entry._last_bytes = entry.received
+            entry._last_time = now
+        if not self._dirty:
+            return
+        rows = [self._rows[entry_id] for entry_id in self._dirty if entry_id in self._rows]
+        self._dirty.clear()
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(COLUMNS) - 1))
+
+    # --- model ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._entries)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self._entries[index.row()]
+        column = index.column()
+        if role == Qt.ToolTipRole:
+            return f"{entry.url}\n{entry.path}"
+        if role != Qt.DisplayRole:
+            return None
+        if column == 0:
+            return os.path.basename(entry.path)
+        if column == 1:
+            return entry.status
+        if column == 2:
+            if entry.total > 0:
+                return f"{_format_bytes(entry.received)} / {_format_bytes(entry.total)} ({entry.received * 100 // entry.total}%)"
+            return _format_bytes(entry.received)
+        if entry.item is None or entry.status != "In Progress":
+            return ""
+        if column == 3:
+            return f"{_format_bytes(entry.speed)}/s"
+        if column == 4 and entry.total > 0 and entry.speed > 0:
+            return _format_eta((entry.total - entry.received) / entry.speed)
+        return ""
@@ -0,0 +1,480 @@
+import json
+import logging
+import math
+import os
+import pickle
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+
+INDEX_DIR = "fulltext"
+# Pages buffered in memory before they are written out as a segment
+FLUSH_DOCS = 50
+# Once there are more segments than this, the smallest ones are merged
+MERGE_FACTOR = 8
+# Retention limits, overridable from settings.json
+MAX_DOCS = 20000
+MAX_AGE_DAYS = 90
+MAX_BYTES = 200 * 1024 * 1024
+# Only the start of very long pages is indexed
+MAX_TEXT_CHARS = 200000
+# Starts every segment file, followed by the offset of its directory
+SEGMENT_MAGIC = b"GKMFTS2\n"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+log = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w{2,40}", re.UNICODE)
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his if in into is it its
+of on or she that the their them there they this to was were which will with you your
+""".split())
+
+
+def tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS and not w.isdigit()]
+
+
+def _encode_postings(postings):
+    # [(doc_id, tf)] sorted by doc_id -> varint-encoded doc id deltas and tfs
+    out = bytearray()
+    last = 0
+    for doc_id, tf in postings:
+        for value in (doc_id - last, tf):
+            while value >= 0x80:
+                out.append((value & 0x7f) | 0x80)
+                value >>= 7
+            out.append(value)
+        last = doc_id
+    return bytes(out)
+
+
+def _decode_postings(data):
+    postings = []
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    last = 0
+    for i in range(0, len(values), 2):
+        last += values[i]
+        postings.append((last, values[i + 1]))
+    return postings
+
+
+class Segment:
+    """An immutable slice of the index on disk.
+
+    The file holds each term's varint-encoded postings back to back,
+    followed by a compressed directory: the document table and where each
+    term's postings are. Only the directory is kept in memory; postings
+    are read from the file when a query or merge needs them.
+    """
+
+    def __init__(self, path, docs, terms):
+        self.path = path
+        self.docs = docs  # doc_id -> (url, title, timestamp, length)
+        self.terms = terms  # term -> (offset, length) of its postings
+
+    @classmethod
+    def write(cls, path, docs, postings):
+        # postings is term -> [(doc_id, tf)] sorted by doc_id
+        terms = {}
+        with open(path + ".tmp", 'wb') as f:
+            f.write(SEGMENT_MAGIC + struct.pack(">Q", 0))
+            offset = f.tell()
+            for term, term_postings in postings.items():
+                data = _encode_postings(term_postings)
+                f.write(data)
+                terms[term] = (offset, len(data))
+                offset += len(data)
+            f.write(zlib.compress(pickle.dumps({"docs": docs, "terms": terms}, pickle.HIGHEST_PROTOCOL)))
+            f.seek(len(SEGMENT_MAGIC))
+            f.write(struct.pack(">Q", offset))
+        os.replace(path + ".tmp", path)
+        return cls(path, docs, terms)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, 'rb') as f:
+            header = f.read(len(SEGMENT_MAGIC) + 8)
+            if header.startswith(SEGMENT_MAGIC):
+                f.seek(struct.unpack(">Q", header[len(SEGMENT_MAGIC):])[0])
+                data = pickle.loads(zlib.decompress(f.read()))
+                return cls(path, data["docs"], data["terms"])
+            # Older versions wrote the whole segment as one compressed
+            # pickle; it is rewritten in the current format once
+            f.seek(0)
+            data = pickle.loads(zlib.decompress(f.read()))
+        postings = {term: _decode_postings(encoded) for term, encoded in data["postings"].items()}
+        return cls.write(path, data["docs"], postings)
+
+    def postings(self, term):
+        entry = self.terms.get(term)
+        if entry is None:
+            return []
+        offset, length = entry
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return _decode_postings(f.read(length))
+
+    def all_postings(self):
+        # (term, postings) for every term, reading the file front to back
+        with open(self.path, 'rb') as f:
+            for term, (offset, length) in sorted(self.terms.items(), key=lambda item: item[1][0]):
+                f.seek(offset)
+                yield term, _decode_postings(f.read(length))
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+
+class FullTextIndex:
+    """Local full-text index of visited pages, searchable with BM25.
+
+    Pages are tokenized on a background thread and buffered; every FLUSH_DOCS
+    pages the buffer becomes a new segment, and the smallest segments are
+    merged once there are more than MERGE_FACTOR of them. Re-indexed URLs
+    and pages past the retention limits are marked deleted and dropped for
+    good when their segment is next merged.
+
+    Opening the index is O(1): the manifest and segment directories are
+    loaded by the background thread, and searches return nothing until it
+    is done. Postings stay on disk until a query reads them.
+    """
+
+    def __init__(self, directory=INDEX_DIR, max_docs=MAX_DOCS, max_age_days=MAX_AGE_DAYS, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_docs = max_docs
+        self.max_age = max_age_days * 86400
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._next_id = 1
+        self._next_segment = 1
+        self._deleted = set()
+        self._segments = []
+        self._latest = {}
+        self._buffer_docs = {}
+        self._buffer_postings = {}
+        # Live documents and their total length, for BM25's n and avgdl
+        self._doc_total = 0
+        self._length_total = 0
+        self._queue.put(("load",))
+
+        self._worker = threading.Thread(target=self._work_loop, name="fulltext-indexer", daemon=True)
+        self._worker.start()
+
+    # --- persistence ---
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _load_manifest(self):
+        # Runs on the worker, before anything else it does
+        manifest = {}
+        try:
+            with open(self._manifest_path(), 'r') as f:
+                manifest = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            pass
+        deleted = set(manifest.get("deleted", []))
+        segments = []
+        for name in manifest.get("segments", []):
+            try:
+                segments.append(Segment.read(os.path.join(self.directory, name)))
+            except (IOError, zlib.error, pickle.UnpicklingError, EOFError, KeyError, struct.error):
+                continue
+        # Latest doc id for each URL, so a revisit replaces the older copy
+        latest = {}
+        doc_total = length_total = 0
+        for segment in segments:
+            for doc_id, (url, _, _, length) in segment.docs.items():
+                if doc_id not in deleted:
+                    doc_total += 1
+                    length_total += length
+                    if doc_id > latest.get(url, 0):
+                        latest[url] = doc_id
+        with self._lock:
+            self._next_id = manifest.get("next_id", 1)
+            self._next_segment = manifest.get("next_segment", 1)
+            self._deleted = deleted
+            self._segments = segments
+            self._latest = latest
+            self._doc_total = doc_total
+            self._length_total = length_total
+
+    def _save_manifest(self):
+        manifest = {
+            "next_id": self._next_id,
+            "next_segment": self._next_segment,
+            "segments": [os.path.basename(s.path) for s in self._segments],
+            "deleted": sorted(self._deleted),
+        }
+        path = self._manifest_path()
+        with open(path + ".tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    # --- public API (any thread) ---
+
+    def add(self, url, title, text, timestamp=None):
+        # Returns immediately; tokenizing and writing happen on the worker
+        self._queue.put(("add", url, title, text[:MAX_TEXT_CHARS], timestamp or time.time()))
+
+    def clear(self):
+        self._queue.put(("clear",))
+
+    def flush(self):
+        # Blocks until everything queued so far is on disk, or the worker is gone
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        while not done.wait(0.5):
+            if not self._worker.is_alive():
+                return
+
+    def close(self):
+        self.flush()
+        self._queue.put(("stop",))
+        self._worker.join()
+
+    def doc_count(self):
+        with self._lock:
+            return self._doc_total
+
+    def search(self, query, limit=50):
+        # Returns [(score, url, title, timestamp)], best first
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            segments = list(self._segments)
+            # The buffer keeps changing on the worker, so copy what the query needs
+            buffer_postings = {t: list(self._buffer_postings[t]) for t in terms if t in self._buffer_postings}
+            buffer_docs = {doc_id: self._buffer_docs[doc_id] for p in buffer_postings.values() for doc_id, _ in p}
+            deleted = set(self._deleted)
+            n = self._doc_total
+            avgdl = self._length_total / n if n else 0
+        if not n:
+            return []
+
+        matches = {term: [] for term in terms}
+        for term in terms:
+            for doc_id, tf in buffer_postings.get(term, ()):
+                if doc_id not in deleted:
+                    matches[term].append((doc_id, tf, buffer_docs[doc_id]))
+        for segment in segments:
+            try:
+                for term in terms:
+                    for doc_id, tf in segment.postings(term):
+                        if doc_id not in deleted:
+                            matches[term].append((doc_id, tf, segment.docs[doc_id]))
+            except OSError:
+                # Merged away since the list was taken; its documents are in the new segment
+                continue
+
+        scores = {}
+        info = {}
+        for term, hits in matches.items():
+            df = len(hits)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for doc_id, tf, doc in hits:
+                length = doc[3] or 1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avgdl))
+                info[doc_id] = doc
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(score, info[doc_id][0], info[doc_id][1], info[doc_id][2]) for doc_id, score in ranked]
+
+    # --- worker ---
+
+    def _delete(self, doc_id):
+        # Called with the lock held
+        if doc_id in self._deleted:
+            return
+        self._deleted.add(doc_id)
+        doc = self._buffer_docs.get(doc_id)
+        for segment in self._segments:
+            if doc is not None:
+                break
+            doc = segment.docs.get(doc_id)
+        if doc is not None:
+            self._doc_total -= 1
+            self._length_total -= doc[3]
+
+    def _work_loop(self):
+        running = True
+        while running:
+            op = self._queue.get()
+            kind = op[0]
+            try:
+                if kind == "load":
+                    self._load_manifest()
+                elif kind == "add":
+                    self._add(*op[1:])
+                    if len(self._buffer_docs) >= FLUSH_DOCS:
+                        self._flush()
+                elif kind == "clear":
+                    self._clear()
+                elif kind == "flush":
+                    self._flush()
+                elif kind == "stop":
+                    running = False
+            except (OSError, zlib.error, pickle.UnpicklingError) as e:
+                # A full disk or a corrupt segment must not take the worker
+                # down; the work is retried with the next flush
+                log.warning("page text index: %s failed: %s", kind, e)
+            finally:
+                if kind == "flush":
+                    op[1].set()
+
+    def _add(self, url, title, text, timestamp):
+        words = tokenize(title + " " + text)
+        if not words:
+            return
+        counts = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        with self._lock:
+            doc_id = self._next_id
+            self._next_id += 1
+            previous = self._latest.get(url)
+            if previous is not None:
+                self._delete(previous)
+            self._latest[url] = doc_id
+            self._buffer_docs[doc_id] = (url, title, timestamp, len(words))
+            self._doc_total += 1
+            self._length_total += len(words)
+            for word, tf in counts.items():
+                self._buffer_postings.setdefault(word, []).append((doc_id, tf))
+
+    def _flush(self):
+        if self._buffer_docs:
+            name = f"seg_{self._next_segment:06d}.idx"
+            segment = Segment.write(os.path.join(self.directory, name), self._buffer_docs, self._buffer_postings)
+            with self._lock:
+                self._next_segment += 1
+                self._segments.append(segment)
+                self._buffer_docs = {}
+                self._buffer_postings = {}
+        self._apply_retention()
+        self._merge()
+        # Deleted documents keep their bytes on disk until their segment is
+        # rewritten, so the byte limit is only met once that has happened
+        while self._disk_bytes() > self.max_bytes and self._compact():
+            self._apply_retention()
+        self._save_manifest()
+
+    def _disk_bytes(self):
+        with self._lock:
+            return sum(s.size() for s in self._segments)
+
+    def _apply_retention(self):
+        # Oldest documents go first; doc ids increase with indexing time.
+        # Each live document is charged an equal share of its segment's file.
+        with self._lock:
+            live = []
+            for segment in self._segments:
+                doc_bytes = segment.size() / len(segment.docs) if segment.docs else 0
+                live.extend((doc_id, doc[2], doc_bytes) for doc_id, doc in segment.docs.items()
+                            if doc_id not in self._deleted)
+            live.sort()
+            cutoff = time.time() - self.max_age
+            excess = max(0, len(live) - self.max_docs)
+            live_bytes = sum(doc_bytes for _, _, doc_bytes in live)
+            for i, (doc_id, timestamp, doc_bytes) in enumerate(live):
+                if i < excess or timestamp < cutoff or live_bytes > self.max_bytes:
+                    self._delete(doc_id)
+                    live_bytes -= doc_bytes
+
+    def _merge(self):
+        # Merge the smallest segments, and any segment that is mostly deleted
+        while True:
+            with self._lock:
+                segments = list(self._segments)
+                deleted = set(self._deleted)
+            mostly_deleted = [s for s in segments
+                              if s.docs and sum(1 for d in s.docs if d in deleted) * 2 >= len(s.docs)]
+            if len(segments) > MERGE_FACTOR:
+                victims = sorted(segments, key=lambda s: len(s.docs))[:MERGE_FACTOR]
+            elif mostly_deleted:
+                victims = mostly_deleted
+            else:
+                return
+            self._rewrite(victims, deleted)
+
+    def _compact(self):
+        # Rewrites every segment holding deleted documents; False if none does
+        with self._lock:
+            deleted = set(self._deleted)
+            victims = [s for s in self._segments if any(doc_id in deleted for doc_id in s.docs)]
+        if not victims:
+            return False
+        self._rewrite(victims, deleted)
+        return True
+
+    def _rewrite(self, victims, deleted):
+        # Replaces victims with one segment of their documents not in deleted
+        docs = {}
+        merged = {}
+        for segment in victims:
+            for doc_id, doc in segment.docs.items():
+                if doc_id not in deleted:
+                    docs[doc_id] = doc
+            for term, postings in segment.all_postings():
+                live = [p for p in postings if p[0] not in deleted]
+                if live:
+                    merged.setdefault(term, []).extend(live)
+        new_segment = None
+        if docs:
+            name = f"seg_{self._next_segment:06d}.idx"
+            postings = {term: sorted(p) for term, p in merged.items()}
+            new_segment = Segment.write(os.path.join(self.directory, name), docs, postings)
+
+        purged = {doc_id for s in victims for doc_id in s.docs}
+        with self._lock:
+            self._next_segment += 1
+            self._segments = [s for s in self._segments if s not in victims]
+            if new_segment is not None:
+                self._segments.append(new_segment)
+            dropped = purged - set(docs)
+            self._deleted -= dropped
+            for url in [u for u, doc_id in self._latest.items() if doc_id in dropped]:
+                del self._latest[url]
+        self._save_manifest()
+        for segment in victims:
+            try:
+                os.remove(segment.path)
+            except OSError:
+                pass
+
+    def _clear(self):
+        with self._lock:
+            segments = self._segments
+            self._segments = []
+            self._buffer_docs = {}
+            self._buffer_postings = {}
+            self._deleted = set()
+            self._latest = {}
+            self._doc_total = 0
+            self._length_total = 0
+        self._save_manifest()
+        for segment in segments:
+            try:
+                os.remove(segment.path)
+            except OSError:
+                pass
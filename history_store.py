@@ -0,0 +1,454 @@
+import datetime
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+# How long the writer waits for more visits before committing a batch (seconds)
+FLUSH_INTERVAL = 0.5
+# Commit early once this many visits are pending
+MAX_BATCH = 500
+
+# Retention defaults, overridable from settings.json
+MAX_AGE_DAYS = 365
+MAX_PAGES = 50000
+# Pages expired per commit, so retention never stalls the writer
+RETENTION_BATCH = 200
+# Seconds between checks of the page count against max_pages
+SIZE_CHECK_INTERVAL = 30
+
+# Same decay as the omnibox: a visit loses half its weight every 30 days.
+# Frecency is stored as log(sum(exp((visit_time - _EPOCH) / _TAU))).
+_TAU = 30 * 24 * 3600 / math.log(2)
+_EPOCH = 1700000000
+
+# Query parameters that only identify the click or campaign; anything with
+# a generic name may be meaningful to the site and is kept
+TRACKING_PARAMS = frozenset("""
+fbclid gclid dclid gbraid wbraid msclkid yclid igshid twclid ttclid mc_cid mc_eid _ga _gl
+""".split())
+TRACKING_PREFIXES = ("utm_",)
+# Parameters Google search adds per query session; they only mean that on
+# its search pages, so they are stripped there alone
+SEARCH_SESSION_PARAMS = frozenset("""
+ei sca_esv sca_upv gs_lp gs_lcp gs_lcrp gs_ssp iflsig ved uact oq aqs sclient sxsrf
+source sourceid biw bih dpr ie oe rlz client sa usg cshid fir
+""".split())
+SEARCH_PATHS = ("/search", "/webhp", "/")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    nav_url TEXT,
+    visit_count INTEGER NOT NULL,
+    first_visit REAL NOT NULL,
+    last_visit REAL NOT NULL,
+    frecency REAL NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_seq ON pages (seq);
+CREATE INDEX IF NOT EXISTS pages_last_visit ON pages (last_visit);
+CREATE INDEX IF NOT EXISTS pages_frecency ON pages (frecency);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# url is the normalized key; nav_url is the page as last visited, which is
+# what is shown and opened. seq is bumped on every visit, so ordering by it
+# lists the most recently visited page first and gives the history view a
+# stable paging key.
+_UPSERT = """
+INSERT INTO pages (url, nav_url, visit_count, first_visit, last_visit, frecency, seq)
+VALUES (?, ?, ?, ?, ?, ?, (SELECT IFNULL(MAX(seq), 0) + 1 FROM pages))
+ON CONFLICT (url) DO UPDATE SET
+    nav_url = CASE WHEN excluded.last_visit >= last_visit THEN excluded.nav_url ELSE nav_url END,
+    visit_count = visit_count + excluded.visit_count,
+    first_visit = MIN(first_visit, excluded.first_visit),
+    last_visit = MAX(last_visit, excluded.last_visit),
+    frecency = logaddexp(frecency, excluded.frecency),
+    seq = excluded.seq
+"""
+
+
+def normalize_url(url):
+    # The key visits to one page are aggregated under: drops the fragment,
+    # default ports, click-tracking parameters and Google's per-search
+    # ones, and lowercases scheme and host. Only used for matching; the
+    # URL as visited is kept for navigation.
+    for scheme in ("https://", "http://"):
+        if url.startswith(scheme):
+            # Most URLs are already normal and skip the full parse
+            host, slash, path = url[len(scheme):].partition("/")
+            if (slash and host and host == host.lower() and not host.endswith(".")
+                    and ":" not in host and "@" not in host and "?" not in path and "#" not in path):
+                return url
+            break
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if parts.scheme not in ("http", "https"):
+        return url
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        # IPv6 literal
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != {"http": 80, "https": 443}[parts.scheme]:
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    search = path in SEARCH_PATHS and _is_google(host)
+    # Parameters are kept exactly as written, bare names included
+    params = [param for param in parts.query.split("&")
+              if param and not _is_tracking(param.split("=", 1)[0], search)]
+    return urlunsplit((parts.scheme, host, path, "&".join(params), ""))
+
+
+def _is_tracking(name, search=False):
+    name = name.lower()
+    return (name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+            or (search and name in SEARCH_SESSION_PARAMS))
+
+
+def _is_google(host):
+    # google.com, www.google.co.in and the like
+    labels = host.split(".")
+    return "google" in labels[:2] and labels[0] in ("google", "www")
+
+
+def visit_score(when):
+    return (when - _EPOCH) / _TAU
+
+
+def _logaddexp(a, b):
+    if a is None:
+        return b
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+def _parse_time(timestamp):
+    # Older entries carry ISO strings, new ones POSIX seconds
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.create_function("logaddexp", 2, _logaddexp, deterministic=True)
+    return conn
+
+
+class _PendingPage:
+    """Visits to one page waiting for the next commit."""
+
+    __slots__ = ("nav_url", "count", "first", "last", "frecency")
+
+    def __init__(self, nav_url, when):
+        self.nav_url = nav_url
+        self.count = 1
+        self.first = when
+        self.last = when
+        self.frecency = visit_score(when)
+
+    def add(self, nav_url, when):
+        self.count += 1
+        self.first = min(self.first, when)
+        if when >= self.last:
+            self.last = when
+            self.nav_url = nav_url
+        self.frecency = _logaddexp(self.frecency, visit_score(when))
+
+
+class _Snapshot:
+    """Every page as (url, last_visit, frecency), as of one point in the writer's queue.
+
+    The writer opens the read once it has committed the visits queued
+    before it, on a connection any thread may use; iterating waits for that.
+    url is the normalized key.
+    """
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._ready = threading.Event()
+        self._conn = None
+        self._cursor = None
+
+    def _open(self, path):
+        # On the writer thread. The statement's first step starts the read
+        # transaction, which keeps this view until the connection closes.
+        try:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._cursor = self._conn.execute("SELECT url, last_visit, frecency FROM pages ORDER BY id")
+        except sqlite3.Error:
+            self._cursor = None
+        self._ready.set()
+
+    def __iter__(self):
+        while not self._ready.wait(0.5):
+            if not self._writer.is_alive():
+                return
+        try:
+            if self._cursor is not None:
+                yield from self._cursor
+        finally:
+            self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _aggregate(pending, url, when):
+    key = normalize_url(url)
+    page = pending.get(key)
+    if page is None:
+        pending[key] = _PendingPage(url, when)
+    else:
+        page.add(url, when)
+
+
+class HistoryStore:
+    """Browsing history aggregated per page, backed by a SQLite WAL database.
+
+    Each normalized URL is one row with its visit count, first and last
+    visit and a decaying frecency score, so the database grows with the
+    number of distinct pages rather than with clicks. Visits are queued from
+    the GUI thread and merged in batches by a background writer thread,
+    which also expires old and low-frecency pages a few at a time.
+    """
+
+    def __init__(self, path, legacy_json=None, max_age_days=MAX_AGE_DAYS, max_pages=MAX_PAGES):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_pages = max_pages
+        self._queue = queue.Queue()
+
+        conn = _connect(path)
+        conn.executescript(_SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(pages)")]
+        if "nav_url" not in columns:
+            # Databases from before nav_url show and open their keys
+            conn.execute("ALTER TABLE pages ADD COLUMN nav_url TEXT")
+        conn.commit()
+        conn.close()
+        # Runs on the writer thread ahead of any new visit
+        self._queue.put(("migrate", legacy_json))
+
+        # Reads happen on the GUI thread; opening the database is O(1) and
+        # rows are only fetched when a view asks for them.
+        self._reader = _connect(path)
+
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _migrate(self, conn, legacy_json):
+        # Folds the raw visits of older versions into pages, exactly once each
+        pending = {}
+        has_visits = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'visits'").fetchone()
+        if has_visits:
+            for url, timestamp in conn.execute("SELECT url, timestamp FROM visits ORDER BY id"):
+                when = _parse_time(timestamp)
+                if when is not None:
+                    _aggregate(pending, url, when)
+        done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+        if legacy_json and not done and os.path.exists(legacy_json):
+            # The file itself is left in place
+            try:
+                with open(legacy_json, 'r') as f:
+                    content = f.read().strip()
+                entries = json.loads(content) if content else []
+            except (json.JSONDecodeError, IOError):
+                entries = []
+            for entry in entries:
+                if isinstance(entry, dict) and "url" in entry:
+                    when = _parse_time(entry.get("timestamp"))
+                    if when is not None:
+                        _aggregate(pending, entry["url"], when)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (legacy_json,))
+        self._commit(conn, pending)
+        if has_visits:
+            conn.execute("DROP TABLE visits")
+        conn.commit()
+
+    # --- writes (GUI thread, non-blocking) ---
+
+    def append(self, url, timestamp):
+        # timestamp is POSIX seconds; the key is derived on the writer thread
+        self._queue.put(("add", url, timestamp))
+
+    def clear(self):
+        self._queue.put(("clear",))
+
+    def snapshot(self):
+        # Pages as of now: the returned iterable includes every visit
+        # appended before this call and none after it. Iterating blocks until
+        # the writer catches up, so it is meant for a worker thread.
+        snapshot = _Snapshot(self._writer)
+        self._queue.put(("snapshot", snapshot))
+        return snapshot
+
+    def request_flush(self):
+        self._queue.put(("flush", None))
+
+    def flush(self):
+        # Blocks until everything queued so far has been committed, for up
+        # to a batch's commit. The GUI thread only calls it where a wait is
+        # expected: opening the history view and shutting down.
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        while not done.wait(0.5):
+            if not self._writer.is_alive():
+                return
+
+    def close(self):
+        self.flush()
+        self._queue.put(("stop",))
+        self._writer.join()
+        self._reader.close()
+
+    # --- reads ---
+
+    def page(self, before_seq=None, limit=200, text=""):
+        # Most-recent-first page of (seq, url, last_visit, visit_count) rows
+        # older than before_seq, optionally restricted to URLs containing
+        # text. Keyset paging keeps deep pages as cheap as the first one.
+        # Only committed visits are seen; callers flush first if they need
+        # the latest ones, so scrolling never waits for the writer.
+        query = "SELECT seq, IFNULL(nav_url, url), last_visit, visit_count FROM pages"
+        clauses = []
+        params = []
+        if before_seq is not None:
+            clauses.append("seq < ?")
+            params.append(before_seq)
+        if text:
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("IFNULL(nav_url, url) LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        return self._reader.execute(query, params).fetchall()
+
+    # --- background writer ---
+
+    def _commit(self, conn, pending):
+        # In visit order, so seq follows the last visit
+        rows = sorted(pending.items(), key=lambda item: item[1].last)
+        conn.executemany(_UPSERT, [(url, p.nav_url, p.count, p.first, p.last, p.frecency) for url, p in rows])
+
+    def _expire(self, conn, now, check_size):
+        # Removes at most RETENTION_BATCH pages per call: first those not
+        # visited within max_age, then the lowest-frecency ones over
+        # max_pages. Pages are only counted when check_size is set; in
+        # between, the excess found then is worked off.
+        removed = conn.execute(
+            "DELETE FROM pages WHERE id IN (SELECT id FROM pages WHERE last_visit < ? ORDER BY last_visit LIMIT ?)",
+            (now - self.max_age, RETENTION_BATCH)
+        ).rowcount
+        if check_size:
+            self._excess = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0] - self.max_pages
+        budget = RETENTION_BATCH - removed
+        if budget > 0 and self._excess > 0:
+            trimmed = conn.execute(
+                "DELETE FROM pages WHERE id IN (SELECT id FROM pages ORDER BY frecency LIMIT ?)",
+                (min(self._excess, budget),)
+            ).rowcount
+            self._excess -= trimmed
+            removed += trimmed
+        return removed
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        pending = {}
+        waiters = []
+        running = True
+        # Keeps expiring between visits until the limits are met again
+        expiring = True
+        self._excess = 0
+        next_size_check = 0
+        while running:
+            try:
+                if waiters:
+                    timeout = 0
+                elif pending or expiring:
+                    timeout = FLUSH_INTERVAL
+                else:
+                    timeout = None
+                op = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                op = ("flush", None)
+
+            kind = op[0]
+            if kind == "add":
+                when = _parse_time(op[2])
+                if when is not None:
+                    _aggregate(pending, op[1], when)
+                if len(pending) < MAX_BATCH:
+                    continue
+            elif kind == "migrate":
+                try:
+                    self._migrate(conn, op[1])
+                except sqlite3.Error:
+                    conn.rollback()
+                continue
+            elif kind == "clear":
+                pending = {}
+                try:
+                    conn.execute("DELETE FROM pages")
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                continue
+            elif kind == "flush":
+                if op[1] is not None:
+                    waiters.append(op[1])
+                # Drain anything else already queued into the same batch
+                if not self._queue.empty():
+                    continue
+            elif kind == "snapshot":
+                # Commits what is pending but, unlike a flush, takes nothing
+                # queued after it into the batch
+                pass
+            elif kind == "stop":
+                running = False
+
+            try:
+                if pending:
+                    self._commit(conn, pending)
+                    expiring = True
+                if expiring and running:
+                    check_size = time.monotonic() >= next_size_check
+                    if check_size:
+                        next_size_check = time.monotonic() + SIZE_CHECK_INTERVAL
+                    expiring = self._expire(conn, time.time(), check_size) == RETENTION_BATCH
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+            pending = {}
+            for event in waiters:
+                event.set()
+            waiters = []
+            if kind == "snapshot":
+                op[1]._open(self.path)
+        conn.close()
@@ -0,0 +1,183 @@
+import argparse
+import getpass
+import json
+import os
+import sys
+from PyQt5.QtCore import QObject
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+# Only Qt's core and network modules are imported here: a second launch
+# hands its URLs over and exits without loading widgets or Chromium
+
+SERVER_NAME = f"gkm-browser-{getpass.getuser()}"
+CONNECT_TIMEOUT_MS = 200
+# Commands answer once done; a full-page capture can take a while
+REPLY_TIMEOUT_MS = {"open": 2000, "list-tabs": 2000, "capture": 120000}
+# Longest request line the server accepts
+MAX_REQUEST = 1024 * 1024
+
+
+def send_command(request, server_name=SERVER_NAME):
+    # Sends one JSON request line and returns the decoded reply, or None when
+    # no browser is running. Works without a QCoreApplication.
+    socket = QLocalSocket()
+    socket.connectToServer(server_name)
+    if not socket.waitForConnected(CONNECT_TIMEOUT_MS):
+        return None
+    socket.write(json.dumps(request).encode('utf-8') + b"\n")
+    socket.flush()
+    timeout = REPLY_TIMEOUT_MS.get(request.get("cmd"), 2000)
+    data = b""
+    while not data.endswith(b"\n"):
+        if not socket.waitForReadyRead(timeout):
+            socket.abort()
+            return {"ok": False, "error": "no reply from the running browser"}
+        data += bytes(socket.readAll())
+    socket.disconnectFromServer()
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {"ok": False, "error": "malformed reply"}
+
+
+# Qt's own command-line options that take the next argument as their value
+QT_VALUE_OPTIONS = frozenset("""
+-platform -platformpluginpath -platformtheme -plugin -qmljsdebugger -style -stylesheet -session
+-display -geometry -title -name -visual -font -fn -background -bg -foreground -fg -button -btn -im
+-qwindowgeometry -qwindowicon -qwindowtitle -dialogs -graphicssystem
+""".split())
+
+
+def split_urls(args):
+    # Separates the URLs on a command line from the options left for Qt, so
+    # that "-platform offscreen" is not taken for an option and a URL.
+    # Everything after "--" is a URL.
+    urls = []
+    qt_args = []
+    args = iter(args)
+    for arg in args:
+        if arg == "--":
+            urls.extend(args)
+        elif arg.startswith("-"):
+            qt_args.append(arg)
+            # Qt accepts its options with one dash or two
+            if "=" not in arg and "-" + arg.lstrip("-") in QT_VALUE_OPTIONS:
+                value = next(args, None)
+                if value is not None:
+                    qt_args.append(value)
+        else:
+            urls.append(arg)
+    return urls, qt_args
+
+
+def hand_off(urls, server_name=SERVER_NAME):
+    # True if a running browser took the URLs (or just got raised, when
+    # there are none), in which case this process has nothing left to do
+    reply = send_command({"cmd": "open", "urls": list(urls)}, server_name)
+    return reply is not None and reply.get("ok", False)
+
+
+class InstanceServer(QObject):
+    """Listens for commands from later launches and scripts.
+
+    The protocol is one JSON object per line in each direction. Requests
+    carry a "cmd" ("open", "list-tabs" or "capture") and its arguments;
+    the handler registered for the command is called as
+    handler(request, reply) and calls reply(dict) once it is done, which
+    may be after the event loop has run.
+    """
+
+    def __init__(self, handlers, server_name=SERVER_NAME, parent=None):
+        super().__init__(parent)
+        self.handlers = handlers
+        self.server_name = server_name
+        self.server = QLocalServer(self)
+        # Only the same user may drive the browser
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.on_new_connection)
+
+    def listen(self):
+        if self.server.listen(self.server_name):
+            return True
+        # A crashed browser leaves its socket file behind
+        if send_command({"cmd": "ping"}, self.server_name) is None:
+            QLocalServer.removeServer(self.server_name)
+            return self.server.listen(self.server_name)
+        return False
+
+    def close(self):
+        self.server.close()
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            buffer = bytearray()
+            socket.readyRead.connect(lambda socket=socket, buffer=buffer: self.on_ready_read(socket, buffer))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def on_ready_read(self, socket, buffer):
+        buffer += bytes(socket.readAll())
+        if len(buffer) > MAX_REQUEST:
+            socket.abort()
+            return
+        while b"\n" in buffer:
+            line, _, rest = bytes(buffer).partition(b"\n")
+            buffer[:] = rest
+            self.dispatch(socket, line)
+
+    def dispatch(self, socket, line):
+        def reply(response):
+            if socket.state() == QLocalSocket.ConnectedState:
+                socket.write(json.dumps(response).encode('utf-8') + b"\n")
+                socket.flush()
+
+        try:
+            request = json.loads(line)
+        except ValueError:
+            reply({"ok": False, "error": "request is not JSON"})
+            return
+        cmd = request.get("cmd") if isinstance(request, dict) else None
+        if cmd == "ping":
+            reply({"ok": True})
+            return
+        handler = self.handlers.get(cmd)
+        if handler is None:
+            reply({"ok": False, "error": f"unknown command: {cmd}"})
+            return
+        try:
+            handler(request, reply)
+        except Exception as e:
+            reply({"ok": False, "error": str(e)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive a running GKM Browser")
+    commands = parser.add_subparsers(dest="cmd", required=True)
+    open_cmd = commands.add_parser("open", help="open URLs in new tabs")
+    open_cmd.add_argument("urls", nargs="+")
+    commands.add_parser("list-tabs", help="print the open tabs as JSON")
+    capture_cmd = commands.add_parser("capture", help="save a screenshot of a tab")
+    capture_cmd.add_argument("output", help="image path; .png, .jpg or .webp")
+    capture_cmd.add_argument("--tab", type=int, help="tab index (default: the current tab)")
+    capture_cmd.add_argument("--full-page", action="store_true")
+    capture_cmd.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "open":
+        request = {"cmd": "open", "urls": args.urls}
+    elif args.cmd == "list-tabs":
+        request = {"cmd": "list-tabs"}
+    else:
+        # The browser resolves paths against its own working directory
+        request = {"cmd": "capture", "path": os.path.abspath(args.output), "tab": args.tab,
+                   "full_page": args.full_page, "scale": args.scale}
+    reply = send_command(request)
+    if reply is None:
+        print("GKM Browser is not running", file=sys.stderr)
+        return 2
+    print(json.dumps(reply, indent=2))
+    return 0 if reply.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
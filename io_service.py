@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QBuffer, QByteArray, QIODevice, pyqtSignal
+
+# Encoding and disk writes rarely need more than a couple of threads
+IO_WORKERS = 2
+
+
+# Read once: the umask can only be read by setting it, which races with
+# other threads creating files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _file_mode(path):
+    # Permissions for a replacement of path: those of the file it replaces,
+    # or what open() would give a new file (mkstemp's own are 0600)
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def _sync_directory(directory):
+    # Persists a rename; not possible on every platform
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class AtomicFile:
+    """A file written under a temporary name in the target's directory.
+
+    commit() fsyncs it and renames it over the target, so readers see either
+    the old file or the new one, never a partial write; discard() drops it.
+    As a context manager it yields the open file and commits unless the
+    block raises.
+    """
+
+    def __init__(self, path, mode='wb', encoding=None):
+        self.path = path
+        self._directory = os.path.dirname(os.path.abspath(path))
+        fd, self._tmp_path = tempfile.mkstemp(dir=self._directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            os.chmod(self._tmp_path, _file_mode(path))
+            self.file = os.fdopen(fd, mode, encoding=encoding)
+        except BaseException:
+            os.close(fd)
+            os.remove(self._tmp_path)
+            raise
+
+    def commit(self):
+        try:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+        _sync_directory(self._directory)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def atomic_write(path, data):
+    with AtomicFile(path) as f:
+        f.write(data)
+
+
+def encode_image(image, fmt, quality=-1):
+    # QImage (unlike QPixmap) may be encoded off the GUI thread
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    if not image.save(buffer, fmt, quality):
+        raise IOError(f"could not encode {fmt} image")
+    buffer.close()
+    return bytes(data)
+
+
+class IOService(QObject):
+    """Runs file saves on a small thread pool, off the GUI thread.
+
+    Each job is a producer returning the bytes to write; encoding happens in
+    the producer, so it runs on the pool too. Writes to the same path are
+    serialized, and a write queued while an earlier one for that path is
+    still waiting replaces it, so a burst of settings changes costs one
+    write. Outcomes come back on the GUI thread as saved(tag, path) or
+    failed(tag, path, message), once for every tag the write stands for.
+    """
+
+    saved = pyqtSignal(str, str)
+    failed = pyqtSignal(str, str, str)
+
+    def __init__(self, workers=IO_WORKERS, parent=None):
+        super().__init__(parent)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gkm-io")
+        self._lock = threading.Lock()
+        self._pending = {}  # path -> (tags, producer), not yet started
+        self._active = set()  # paths with a job on the pool
+
+    def write(self, path, producer, tag=""):
+        # producer is bytes, or a callable returning bytes to run on the pool
+        with self._lock:
+            # A replaced job's tags are reported with the write replacing it
+            tags = self._pending[path][0] if path in self._pending else []
+            if tag not in tags:
+                tags.append(tag)
+            self._pending[path] = (tags, producer)
+            if path in self._active:
+                return
+            self._active.add(path)
+        self._pool.submit(self._run, path)
+
+    def write_text(self, path, text, tag=""):
+        self.write(path, lambda: text.encode('utf-8'), tag)
+
+    def write_json(self, path, obj, tag=""):
+        # Serialized now, on the calling thread, since obj may change afterwards
+        self.write(path, json.dumps(obj).encode('utf-8'), tag)
+
+    def write_image(self, path, image, fmt="PNG", quality=-1, tag=""):
+        self.write(path, lambda: encode_image(image, fmt, quality), tag)
+
+    def close(self):
+        # Waits for every queued write
+        self._pool.shutdown(wait=True)
+
+    def _run(self, path):
+        while True:
+            with self._lock:
+                job = self._pending.pop(path, None)
+                if job is None:
+                    self._active.discard(path)
+                    return
+            tags, producer = job
+            try:
+                atomic_write(path, producer() if callable(producer) else producer)
+            except Exception as e:
+                for tag in tags:
+                    self.failed.emit(tag, path, str(e))
+            else:
+                for tag in tags:
+                    self.saved.emit(tag, path)
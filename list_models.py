@@ -0,0 +1,162 @@
+import datetime
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QTimer, Qt
+
+# Rows fetched from the backing store each time the view scrolls to the end
+PAGE_SIZE = 200
+# Bookmarks checked against the filter per event-loop turn
+SCAN_LIMIT = 2000
+# Role carrying the entry's URL, used by the double-click handlers
+URL_ROLE = Qt.UserRole
+
+
+class HistoryModel(QAbstractListModel):
+    """Most recently visited pages first, paged from the history store as the view scrolls."""
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.filter_text = ""
+        self._rows = []
+        self._exhausted = False
+        # Waits for the writer once, here, rather than on every page fetched
+        store.flush()
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self.filter_text = text.strip()
+        self._rows = []
+        self._exhausted = False
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        _, url, last_visit, visit_count = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            when = datetime.datetime.fromtimestamp(last_visit).isoformat(" ", "seconds")
+            return f"{when} - {url} ({visit_count})" if visit_count > 1 else f"{when} - {url}"
+        if role == URL_ROLE:
+            return url
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        before_seq = self._rows[-1][0] if self._rows else None
+        rows = self.store.page(before_seq, PAGE_SIZE, self.filter_text)
+        if len(rows) < PAGE_SIZE:
+            self._exhausted = True
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+
+
+class BookmarkModel(QAbstractListModel):
+    """Bookmarks in insertion order, matched against the filter a page at a time.
+
+    The filter matches the name, URL, folder or any tag. At most SCAN_LIMIT
+    bookmarks are checked per event-loop turn; a page still short of
+    matches carries on in the next turn, so a filter that rarely matches
+    never blocks the GUI on a full scan.
+    """
+
+    def __init__(self, bookmarks, parent=None):
+        super().__init__(parent)
+        self.bookmarks = bookmarks
+        self.filter_text = ""
+        self._matches = []
+        self._scanned = 0
+        # Bookmarks added after the filter was set are not listed, so the
+        # rows never shift under the view
+        self._end = len(bookmarks)
+        self._page_left = 0
+        self._continue = QTimer(self)
+        self._continue.setSingleShot(True)
+        self._continue.timeout.connect(self._scan)
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self._continue.stop()
+        self.filter_text = text.strip().lower()
+        self._end = len(self.bookmarks)
+        self._matches = []
+        self._scanned = 0
+        self.endResetModel()
+
+    def _matches_filter(self, bookmark):
+        text = self.filter_text
+        return (not text or text in bookmark.name.lower() or text in bookmark.url.lower()
+                or text in bookmark.folder.lower() or any(text in tag.lower() for tag in bookmark.tags))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._matches)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        bookmark = self._matches[index.row()]
+        if role == Qt.DisplayRole:
+            name = f"{bookmark.folder} / {bookmark.name}" if bookmark.folder else bookmark.name
+            return f"{name}  [{', '.join(bookmark.tags)}]" if bookmark.tags else name
+        if role == Qt.ToolTipRole or role == URL_ROLE:
+            return bookmark.url
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._scanned < self._end and not self._continue.isActive()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        self._page_left = PAGE_SIZE
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for bookmark in self.bookmarks.entries(self._scanned, min(self._end, self._scanned + SCAN_LIMIT)):
+            self._scanned += 1
+            if self._matches_filter(bookmark):
+                found.append(bookmark)
+                if len(found) >= self._page_left:
+                    break
+        self._page_left -= len(found)
+        if found:
+            self.beginInsertRows(QModelIndex(), len(self._matches), len(self._matches) + len(found) - 1)
+            self._matches.extend(found)
+            self.endInsertRows()
+        if self._page_left > 0 and self._scanned < self._end:
+            self._continue.start(0)
+
+
+class PageTextModel(QAbstractListModel):
+    """Full-text search results over visited pages, ranked by the index."""
+
+    def __init__(self, fulltext, parent=None):
+        super().__init__(parent)
+        self.fulltext = fulltext
+        self._results = []
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self._results = self.fulltext.search(text, PAGE_SIZE) if text.strip() else []
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._results)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        _, url, title, _ = self._results[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{title or url} - {url}"
+        if role == URL_ROLE:
+            return url
+        return None
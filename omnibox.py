@@ -0,0 +1,216 @@
+import heapq
+import math
+import re
+from array import array
+
+# Visits lose half of their weight every 30 days
+HALF_LIFE = 30 * 24 * 3600
+_TAU = HALF_LIFE / math.log(2)
+# Reference point for the log-domain scores, keeps the exponents small
+_EPOCH = 1700000000
+# A bookmark counts as this many fresh visits
+BOOKMARK_BONUS = math.log(10)
+
+# Prefixes up to this length keep a ranked candidate list
+PREFIX_LEN = 6
+# Size of each ranked candidate list
+TOP_K = 32
+
+_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+def _strip_scheme(url):
+    url = url.lower()
+    for scheme in ("https://", "http://"):
+        if url.startswith(scheme):
+            url = url[len(scheme):]
+            break
+    if url.startswith("www."):
+        url = url[4:]
+    return url
+
+
+def _tokens(url, title=""):
+    # The bare URL itself plus every word of the URL and title
+    bare = _strip_scheme(url)
+    words = {bare}
+    words.update(w for w in _SPLIT.split(bare) if w)
+    if title:
+        words.update(w for w in _SPLIT.split(title.lower()) if w)
+    return words
+
+
+def _prefixes(url, title=""):
+    # Word prefixes up to PREFIX_LEN, plus every prefix of the bare URL up to
+    # the end of its host so that "github.com/..." narrows to that site
+    bare = _strip_scheme(url)
+    prefixes = set()
+    for token in _tokens(url, title):
+        prefixes.update(token[:n] for n in range(1, min(len(token), PREFIX_LEN) + 1))
+    host_end = bare.find("/")
+    host_end = len(bare) if host_end < 0 else host_end + 1
+    prefixes.update(bare[:n] for n in range(PREFIX_LEN + 1, host_end + 1))
+    return prefixes
+
+
+def _logaddexp(a, b):
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+class OmniboxIndex:
+    """Incremental prefix index over history and bookmarks, ranked by frecency.
+
+    Frecency is kept in the log domain as log(sum(exp(visit_time / tau))), so
+    every visit decays at the same rate and scores only ever grow. That lets
+    each prefix keep a small top-k list that is updated in place on every
+    visit instead of being rebuilt.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._urls = []
+        self._titles = []
+        self._scores = []
+        self._bookmarked = []
+        self._prefixes = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._urls)
+
+    def clear(self):
+        self.__init__()
+
+    def _entry(self, url, title):
+        entry_id = self._ids.get(url)
+        if entry_id is None:
+            entry_id = len(self._urls)
+            self._ids[url] = entry_id
+            self._urls.append(url)
+            self._titles.append(title)
+            self._scores.append(-math.inf)
+            self._bookmarked.append(False)
+            for token in _tokens(url, title):
+                self._postings.setdefault(token, array('I')).append(entry_id)
+        elif title and not self._titles[entry_id]:
+            self._titles[entry_id] = title
+            for token in _tokens("", title):
+                self._postings.setdefault(token, array('I')).append(entry_id)
+        return entry_id
+
+    def _score(self, entry_id):
+        score = self._scores[entry_id]
+        if self._bookmarked[entry_id]:
+            score += BOOKMARK_BONUS
+        return score
+
+    def _rank(self, entry_id):
+        # Push the entry's new score into the top-k list of each of its prefixes
+        score = self._score(entry_id)
+        for prefix in _prefixes(self._urls[entry_id], self._titles[entry_id]):
+            ranked = self._prefixes.get(prefix)
+            if ranked is None:
+                self._prefixes[prefix] = [(score, entry_id)]
+                continue
+            # Scores never drop, so anything below the cut-off was never listed
+            if len(ranked) >= TOP_K and score < ranked[-1][0]:
+                continue
+            for i, (_, other) in enumerate(ranked):
+                if other == entry_id:
+                    del ranked[i]
+                    break
+            else:
+                if len(ranked) >= TOP_K and score <= ranked[-1][0]:
+                    continue
+            pos = len(ranked)
+            while pos > 0 and ranked[pos - 1][0] < score:
+                pos -= 1
+            ranked.insert(pos, (score, entry_id))
+            del ranked[TOP_K:]
+
+    def add_visit(self, url, when, title=""):
+        # when is a POSIX timestamp
+        entry_id = self._entry(url, title)
+        visit = (when - _EPOCH) / _TAU
+        current = self._scores[entry_id]
+        self._scores[entry_id] = visit if current == -math.inf else _logaddexp(current, visit)
+        self._rank(entry_id)
+
+    def add_pages(self, pages):
+        # Bulk load of (url, frecency) pairs, frecency being a log-domain sum
+        # of visits like the history store keeps per page
+        touched = set()
+        for url, frecency in pages:
+            entry_id = self._entry(url, "")
+            current = self._scores[entry_id]
+            self._scores[entry_id] = frecency if current == -math.inf else _logaddexp(current, frecency)
+            touched.add(entry_id)
+        # Group by prefix and merge each group into its top-k list in one go
+        grouped = {}
+        for entry_id in touched:
+            score = self._score(entry_id)
+            for prefix in _prefixes(self._urls[entry_id], self._titles[entry_id]):
+                grouped.setdefault(prefix, []).append((score, entry_id))
+        for prefix, scored in grouped.items():
+            ranked = self._prefixes.get(prefix)
+            if ranked:
+                scored.extend(item for item in ranked if item[1] not in touched)
+            self._prefixes[prefix] = heapq.nlargest(TOP_K, scored)
+
+    def add_bookmark(self, url, title, when):
+        # A never-visited bookmark is scored as if it was visited when added
+        entry_id = self._entry(url, title)
+        if self._scores[entry_id] == -math.inf:
+            self._scores[entry_id] = (when - _EPOCH) / _TAU
+        if not self._bookmarked[entry_id]:
+            self._bookmarked[entry_id] = True
+            self._rank(entry_id)
+
+    def _matches(self, entry_id, terms):
+        url = self._urls[entry_id]
+        bare = _strip_scheme(url)
+        tokens = None
+        for term in terms:
+            if bare.startswith(term):
+                continue
+            if tokens is None:
+                tokens = _tokens(url, self._titles[entry_id])
+            if not any(token.startswith(term) for token in tokens):
+                return False
+        return True
+
+    def search(self, text, limit=8):
+        # Returns [(url, title)], best match first
+        text = text.strip()
+        if not text:
+            return []
+        terms = [_strip_scheme(t) for t in text.split()]
+        terms = [t for t in terms if t]
+        if not terms:
+            return []
+        longest = max(terms, key=len)
+
+        # Longest indexed prefix of the longest term
+        ranked = ()
+        for n in range(len(longest), 0, -1):
+            ranked = self._prefixes.get(longest[:n])
+            if ranked is not None:
+                break
+        candidates = [entry_id for _, entry_id in ranked or ()]
+        if len(longest) > PREFIX_LEN:
+            # Whole words that fell out of the shorter prefix's top-k list
+            for token in (longest, longest.rstrip("/")):
+                candidates.extend(self._postings.get(token, ())[-TOP_K:])
+
+        seen = set()
+        results = []
+        for entry_id in candidates:
+            if entry_id in seen:
+                continue
+            seen.add(entry_id)
+            if self._matches(entry_id, terms):
+                results.append(entry_id)
+        results.sort(key=self._score, reverse=True)
+        return [(self._urls[i], self._titles[i]) for i in results[:limit]]
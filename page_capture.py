@@ -0,0 +1,314 @@
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QImageWriter, QPainter, QColor
+from PyQt5.QtWebEngineWidgets import QWebEngineScript, QWebEngineSettings
+from io_service import AtomicFile, atomic_write, encode_image
+
+# Output formats; only PNG is streamed, the others need the whole
+# (downscaled) image in memory to encode
+IMAGE_FORMATS = {"png": "PNG", "jpg": "JPEG", "webp": "WEBP"}
+# Largest dimension each encoder accepts
+FORMAT_LIMITS = {"PNG": 2 ** 31 - 1, "JPEG": 65500, "WEBP": 16383}
+# Pages taller than this (CSS pixels) are cut off
+MAX_PAGE_HEIGHT = 200000
+# Time for the page to repaint after each scroll
+SETTLE_MS = 150
+# Uncompressed PNG data collected before an IDAT chunk is written
+PNG_CHUNK = 256 * 1024
+
+_MEASURE_JS = """
+(function() {
+    var doc = document.documentElement;
+    var height = Math.max(doc.scrollHeight, document.body ? document.body.scrollHeight : 0);
+    return [height, window.innerHeight, window.scrollX, window.scrollY];
+})()
+"""
+
+# Fixed and sticky elements would otherwise repeat in every tile
+_HIDE_FIXED_JS = """
+(function() {
+    var hidden = window.__gkmCaptureHidden = [];
+    var all = document.body ? document.body.getElementsByTagName('*') : [];
+    for (var i = 0; i < all.length; i++) {
+        var position = getComputedStyle(all[i]).position;
+        if (position === 'fixed' || position === 'sticky') {
+            hidden.push([all[i], all[i].style.visibility]);
+            all[i].style.visibility = 'hidden';
+        }
+    }
+})()
+"""
+
+_RESTORE_JS = """
+(function(x, y) {
+    (window.__gkmCaptureHidden || []).forEach(function(item) { item[0].style.visibility = item[1]; });
+    delete window.__gkmCaptureHidden;
+    window.scrollTo(x, y);
+})(%d, %d)
+"""
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+class PngStreamWriter:
+    """Writes an RGB PNG a band of rows at a time.
+
+    Rows are deflated as they arrive, so memory stays at one band no matter
+    how tall the image is. The file appears under its final name on close.
+    """
+
+    def __init__(self, path, width, height, level=6):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self._output = AtomicFile(path)
+        self._file = self._output.file
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        self._deflate = zlib.compressobj(level)
+        self._pending = []
+        self._pending_size = 0
+
+    def write_image(self, image):
+        # Appends the rows of a QImage as wide as the output
+        image = image.convertToFormat(QImage.Format_RGB888)
+        stride = image.bytesPerLine()
+        row_bytes = self.width * 3
+        bits = image.constBits()
+        bits.setsize(stride * image.height())
+        data = bits.asstring()
+        for y in range(min(image.height(), self.height - self.rows)):
+            self._add(b"\x00" + data[y * stride:y * stride + row_bytes])
+        self.rows = min(self.height, self.rows + image.height())
+
+    def _add(self, row):
+        self._pending.append(self._deflate.compress(row))
+        self._pending_size += len(row)
+        if self._pending_size >= PNG_CHUNK:
+            self._write_idat()
+
+    def _write_idat(self):
+        data = b"".join(self._pending)
+        if data:
+            self._file.write(_chunk(b"IDAT", data))
+        self._pending = []
+        self._pending_size = 0
+
+    def close(self):
+        # Rounding can leave the last tile a row short; pad with white
+        blank = b"\x00" + b"\xff" * (self.width * 3)
+        while self.rows < self.height:
+            self._add(blank)
+            self.rows += 1
+        self._pending.append(self._deflate.flush())
+        self._write_idat()
+        self._file.write(_chunk(b"IEND", b""))
+        self._output.commit()
+
+    def abort(self):
+        self._output.discard()
+
+
+class FullPageCapture(QObject):
+    """Captures a whole page from a view by scrolling through it a viewport at a time.
+
+    Each tile is grabbed, cropped to the rows not yet captured, optionally
+    downscaled, and handed to an encoder thread while the next scroll
+    settles; at most two tiles are alive at once. finished(ok, report) is
+    emitted with the image size, tile count and a timing breakdown.
+    """
+
+    finished = pyqtSignal(bool, object)
+    # Emitted from the encoder thread once the file is written, with an error or ""
+    _written = pyqtSignal(str)
+
+    def __init__(self, view, path, fmt="png", scale=1.0, quality=-1, max_height=MAX_PAGE_HEIGHT, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.path = path
+        self.fmt = IMAGE_FORMATS[fmt]
+        self.scale = scale
+        self.quality = quality
+        self.max_height = max_height
+        self._encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gkm-capture")
+        self._encoding = None
+        self._output = None
+        self._out_rows_written = 0
+        self._done = False
+        self._written.connect(self._on_written)
+        self.report = {"path": path, "format": fmt, "tiles": 0, "truncated": False,
+                       "settle_ms": 0.0, "grab_ms": 0.0, "encode_ms": 0.0}
+
+    def start(self):
+        if self.fmt not in [bytes(f).decode().upper() for f in QImageWriter.supportedImageFormats()]:
+            self._finish(False, f"{self.fmt} images are not supported by this Qt build")
+            return
+        self._started = time.perf_counter()
+        self.report["url"] = self.view.url().toString()
+        settings = self.view.settings()
+        self._scrollbars = settings.testAttribute(QWebEngineSettings.ShowScrollBars)
+        settings.setAttribute(QWebEngineSettings.ShowScrollBars, False)
+        self.view.page().runJavaScript(_MEASURE_JS, QWebEngineScript.ApplicationWorld, self._on_measured)
+
+    def cancel(self):
+        # Stops at the next step; finished is still emitted, with ok False
+        self._finish(False, "cancelled")
+
+    def _on_measured(self, result):
+        if self._done:
+            return
+        if not result:
+            self._finish(False, "page could not be measured")
+            return
+        page_height, self._viewport_height, scroll_x, scroll_y = [int(v) for v in result]
+        self._restore = (scroll_x, scroll_y)
+        if self._viewport_height <= 0 or page_height <= 0:
+            # A hidden or collapsed view has nothing to scroll through
+            self._finish(False, "page has no visible area")
+            return
+        self._page_height = min(page_height, self.max_height)
+        self.report["truncated"] = page_height > self.max_height
+        self._next_y = 0
+        self._scroll_to(0)
+
+    def _scroll_to(self, y):
+        self.view.page().runJavaScript(f"window.scrollTo(0, {y})", QWebEngineScript.ApplicationWorld)
+        self._settle_started = time.perf_counter()
+        QTimer.singleShot(SETTLE_MS, lambda: self.view.page().runJavaScript(
+            "window.scrollY", QWebEngineScript.ApplicationWorld, self._on_settled))
+
+    def _on_settled(self, scroll_y):
+        if self._done:
+            return
+        self.report["settle_ms"] += (time.perf_counter() - self._settle_started) * 1000
+        scroll_y = int(scroll_y or 0)
+        grab_started = time.perf_counter()
+        image = self.view.grab().toImage()
+        self.report["grab_ms"] += (time.perf_counter() - grab_started) * 1000
+
+        # Physical pixels per CSS pixel
+        ratio = image.height() / self._viewport_height
+        if self._output is None and not self._open(image.width(), round(self._page_height * ratio)):
+            return
+        bottom = min(self._page_height, scroll_y + self._viewport_height)
+        if bottom <= self._next_y:
+            # The page refused to scroll any further
+            self._complete()
+            return
+        top_row = round((self._next_y - scroll_y) * ratio)
+        tile = image.copy(0, top_row, image.width(), round((bottom - scroll_y) * ratio) - top_row)
+        del image
+
+        # Wait for the previous tile before queuing this one, so memory
+        # holds at most two tiles
+        if not self._wait_encoder():
+            return
+        out_rows = round(round(bottom * ratio) * self._scale) - self._out_rows
+        self._out_rows += out_rows
+        self._encoding = self._encoder.submit(self._encode_tile, tile, out_rows)
+        self.report["tiles"] += 1
+        self._next_y = bottom
+
+        if bottom >= self._page_height:
+            self._complete()
+            return
+        if self.report["tiles"] == 1:
+            self.view.page().runJavaScript(_HIDE_FIXED_JS, QWebEngineScript.ApplicationWorld)
+        self._scroll_to(bottom)
+
+    def _open(self, width, height):
+        # The encoders' size limits cap the effective scale
+        limit = FORMAT_LIMITS[self.fmt]
+        self._scale = min(self.scale, limit / max(width, height, 1))
+        self._width = max(1, round(width * self._scale))
+        self._height = max(1, round(height * self._scale))
+        self._out_rows = 0
+        self.report.update(width=self._width, height=self._height, scale=round(self._scale, 4))
+        try:
+            if self.fmt == "PNG":
+                self._output = PngStreamWriter(self.path, self._width, self._height)
+            else:
+                self._output = QImage(self._width, self._height, QImage.Format_RGB32)
+                self._output.fill(QColor(Qt.white))
+                if self._output.isNull():
+                    raise MemoryError(f"no memory for a {self._width}x{self._height} image")
+        except (OSError, MemoryError) as e:
+            self._output = None
+            self._finish(False, str(e))
+            return False
+        return True
+
+    def _encode_tile(self, tile, out_rows):
+        started = time.perf_counter()
+        if out_rows > 0:
+            if tile.width() != self._width or tile.height() != out_rows:
+                tile = tile.scaled(self._width, out_rows, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            if self.fmt == "PNG":
+                self._output.write_image(tile)
+            else:
+                painter = QPainter(self._output)
+                painter.drawImage(0, self._out_rows_written, tile)
+                painter.end()
+            self._out_rows_written += out_rows
+        return (time.perf_counter() - started) * 1000
+
+    def _wait_encoder(self):
+        if self._encoding is None:
+            return True
+        try:
+            self.report["encode_ms"] += self._encoding.result()
+        except Exception as e:
+            self._finish(False, f"encoding failed: {e}")
+            return False
+        finally:
+            self._encoding = None
+        return True
+
+    def _complete(self):
+        if not self._wait_encoder():
+            return
+        self._encoder.submit(self._write_output)
+
+    def _write_output(self):
+        started = time.perf_counter()
+        try:
+            if self.fmt == "PNG":
+                self._output.close()
+            else:
+                atomic_write(self.path, encode_image(self._output, self.fmt, self.quality))
+        except (OSError, IOError) as e:
+            self._written.emit(str(e))
+            return
+        self.report["encode_ms"] += (time.perf_counter() - started) * 1000
+        self._output = None
+        self._written.emit("")
+
+    def _on_written(self, error):
+        self._finish(not error, error or None)
+
+    def _finish(self, ok, error=None):
+        if self._done:
+            return
+        self._done = True
+        # The encoder may still be writing a tile into the output
+        self._encoder.shutdown(wait=True)
+        if isinstance(self._output, PngStreamWriter):
+            self._output.abort()
+        self._output = None
+        if hasattr(self, "_started"):
+            self.view.settings().setAttribute(QWebEngineSettings.ShowScrollBars, self._scrollbars)
+            if hasattr(self, "_restore"):
+                self.view.page().runJavaScript(_RESTORE_JS % self._restore, QWebEngineScript.ApplicationWorld)
+            self.report["total_ms"] = (time.perf_counter() - self._started) * 1000
+        for key in ("settle_ms", "grab_ms", "encode_ms", "total_ms"):
+            if key in self.report:
+                self.report[key] = round(self.report[key], 1)
+        self.report["ok"] = ok
+        self.report["error"] = error
+        self.finished.emit(ok, self.report)
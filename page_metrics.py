@@ -0,0 +1,161 @@
+import json
+import math
+import time
+from collections import deque
+from urllib.parse import urlsplit
+from PyQt5.QtCore import QObject
+from PyQt5.QtWebEngineWidgets import QWebEngineScript
+from tab_lifecycle import process_memory
+
+METRICS_FILE = "page_metrics.jsonl"
+# Samples kept per host for the percentiles
+SAMPLE_LIMIT = 500
+
+SCRIPT_NAME = "gkm-page-metrics"
+# Lives in the application world, so pages can neither see nor tamper with it
+METRICS_SCRIPT = """
+window.__gkmPageMetrics = function() {
+    var result = {resources: 0, resource_bytes: 0};
+    var nav = performance.getEntriesByType('navigation')[0];
+    if (nav) {
+        result.dns_ms = nav.domainLookupEnd - nav.domainLookupStart;
+        result.connect_ms = nav.connectEnd - nav.connectStart;
+        result.ttfb_ms = nav.responseStart;
+        result.dom_content_loaded_ms = nav.domContentLoadedEventEnd;
+        result.load_event_ms = nav.loadEventEnd;
+        result.transfer_bytes = nav.transferSize;
+    }
+    var resources = performance.getEntriesByType('resource');
+    result.resources = resources.length;
+    for (var i = 0; i < resources.length; i++) {
+        result.resource_bytes += resources[i].transferSize || 0;
+    }
+    return result;
+};
+"""
+COLLECT_CALL = "window.__gkmPageMetrics ? window.__gkmPageMetrics() : null"
+
+# Per-host figures shown in the diagnostics panel
+SUMMARY_METRICS = ["load_ms", "ttfb_ms", "dom_content_loaded_ms"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class HostStats:
+    __slots__ = ("loads", "failures", "samples", "memory")
+
+    def __init__(self):
+        self.loads = 0
+        self.failures = 0
+        self.samples = {name: deque(maxlen=SAMPLE_LIMIT) for name in SUMMARY_METRICS}
+        self.memory = 0
+
+    def add(self, record):
+        self.loads += 1
+        if not record["ok"]:
+            self.failures += 1
+            return
+        for name in SUMMARY_METRICS:
+            value = record.get(name)
+            if value is not None:
+                self.samples[name].append(value)
+        self.memory = record.get("memory_bytes") or self.memory
+
+
+class PageMetrics(QObject):
+    """Per-tab page-load instrumentation.
+
+    loadStarted/loadProgress/loadFinished give the browser-side timings, the
+    injected METRICS_SCRIPT supplies Navigation and Resource Timing, and the
+    render process's memory is sampled when the load finishes. Each load is
+    appended to page_metrics.jsonl and folded into per-host p50/p95 figures.
+    Off-the-record tabs are never measured.
+    """
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.log_path = settings.get("page_metrics_log", METRICS_FILE)
+        self.hosts = {}
+        self._loads = {}
+
+    def install(self, profile):
+        if profile.isOffTheRecord() or profile.scripts().findScript(SCRIPT_NAME).name():
+            return
+        script = QWebEngineScript()
+        script.setName(SCRIPT_NAME)
+        script.setSourceCode(METRICS_SCRIPT)
+        script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+        script.setWorldId(QWebEngineScript.ApplicationWorld)
+        script.setRunsOnSubFrames(False)
+        profile.scripts().insert(script)
+
+    def attach(self, view):
+        if view.page().profile().isOffTheRecord():
+            return
+        view.loadStarted.connect(lambda: self.on_load_started(view))
+        view.loadProgress.connect(lambda progress: self.on_load_progress(view, progress))
+        view.loadFinished.connect(lambda ok: self.on_load_finished(view, ok))
+
+    def detach(self, view):
+        self._loads.pop(view, None)
+
+    def on_load_started(self, view):
+        self._loads[view] = {"started": time.perf_counter(), "first_progress_ms": None}
+
+    def on_load_progress(self, view, progress):
+        load = self._loads.get(view)
+        if load is not None and load["first_progress_ms"] is None and progress > 0:
+            load["first_progress_ms"] = (time.perf_counter() - load["started"]) * 1000
+
+    def on_load_finished(self, view, ok):
+        load = self._loads.pop(view, None)
+        if load is None:
+            return
+        page = view.page()
+        record = {
+            "time": time.time(),
+            "url": view.url().toString(),
+            "ok": ok,
+            "load_ms": round((time.perf_counter() - load["started"]) * 1000, 1),
+            "first_progress_ms": load["first_progress_ms"] and round(load["first_progress_ms"], 1),
+            "memory_bytes": process_memory(page.renderProcessPid()),
+        }
+        if not ok:
+            self.add_record(record)
+            return
+        page.runJavaScript(COLLECT_CALL, QWebEngineScript.ApplicationWorld,
+                           lambda timing: self.on_timing(record, timing))
+
+    def on_timing(self, record, timing):
+        if isinstance(timing, dict):
+            for key, value in timing.items():
+                record[key] = round(value, 1) if isinstance(value, float) else value
+        self.add_record(record)
+
+    def add_record(self, record):
+        host = urlsplit(record["url"]).hostname or ""
+        self.hosts.setdefault(host, HostStats()).add(record)
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+        except IOError:
+            pass
+
+    def summary(self):
+        # One row per host, busiest first: {"host", "loads", "failures", "memory_bytes", "<metric>_p50", "<metric>_p95"}
+        rows = []
+        for host, stats in self.hosts.items():
+            row = {"host": host, "loads": stats.loads, "failures": stats.failures, "memory_bytes": stats.memory}
+            for name in SUMMARY_METRICS:
+                values = sorted(stats.samples[name])
+                row[f"{name}_p50"] = percentile(values, 0.50)
+                row[f"{name}_p95"] = percentile(values, 0.95)
+            rows.append(row)
+        rows.sort(key=lambda row: row["loads"], reverse=True)
+        return rows
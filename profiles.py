@@ -0,0 +1,52 @@
+import os
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWebEngineWidgets import QWebEngineProfile
+from startup_trace import trace
+
+PROFILE_NAME = "gkm"
+PROFILE_DIR = "profile"
+# Default on-disk HTTP cache size, overridable with "http_cache_size_mb" in settings.json
+HTTP_CACHE_SIZE_MB = 256
+
+
+class ProfileManager(QObject):
+    """Hands out one shared profile for normal tabs and one for incognito tabs.
+
+    Every tab of the same kind uses the same profile, so they share the HTTP
+    cache, cookies and network connections. Profiles are created on first use
+    and profile_created is emitted exactly once for each, which is where
+    per-profile signals such as downloadRequested get connected.
+    """
+
+    profile_created = pyqtSignal(QWebEngineProfile)
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.storage_path = os.path.abspath(settings.get("profile_path", PROFILE_DIR))
+        self.cache_path = os.path.abspath(
+            settings.get("http_cache_path", os.path.join(self.storage_path, "cache"))
+        )
+        self.cache_size = int(settings.get("http_cache_size_mb", HTTP_CACHE_SIZE_MB)) * 1024 * 1024
+        self._normal = None
+        self._incognito = None
+
+    def profile(self, incognito=False):
+        if incognito:
+            if self._incognito is None:
+                # A profile without a storage name is off-the-record: nothing
+                # it caches or stores outlives the session
+                self._incognito = QWebEngineProfile(self)
+                self._incognito.setHttpCacheType(QWebEngineProfile.MemoryHttpCache)
+                self.profile_created.emit(self._incognito)
+            return self._incognito
+
+        if self._normal is None:
+            with trace.span("profile_creation"):
+                self._normal = QWebEngineProfile(PROFILE_NAME, self)
+                self._normal.setPersistentStoragePath(self.storage_path)
+                self._normal.setCachePath(self.cache_path)
+                self._normal.setHttpCacheType(QWebEngineProfile.DiskHttpCache)
+                self._normal.setHttpCacheMaximumSize(self.cache_size)
+                self._normal.setPersistentCookiesPolicy(QWebEngineProfile.AllowPersistentCookies)
+                self.profile_created.emit(self._normal)
+        return self._normal
@@ -0,0 +1,42 @@
+import json
+import os
+from PyQt5.QtWidgets import QWidget
+
+SESSION_FILE = "session.json"
+
+
+class TabPlaceholder(QWidget):
+    """Stands in for a restored tab until it is first selected.
+
+    Holds the saved tab state ({"url", "title", "zoom", "scroll"}) without
+    creating a QWebEngineView, so restoring a large session costs no more
+    than opening a single tab.
+    """
+
+    def __init__(self, state, parent=None):
+        super().__init__(parent)
+        self.state = state
+
+
+def load_session(path=SESSION_FILE):
+    # Returns {"tabs": [...], "current": index}, or None when there is nothing to restore
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            session = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+    tabs = [t for t in session.get("tabs", []) if isinstance(t, dict) and t.get("url")]
+    if not tabs:
+        return None
+    current = session.get("current", 0)
+    if not isinstance(current, int) or not 0 <= current < len(tabs):
+        current = 0
+    return {"tabs": tabs, "current": current}
+
+
+def save_session(io, tabs, current, path=SESSION_FILE):
+    # io is an io_service.IOService; the write is atomic, so a crash never
+    # leaves a truncated session
+    io.write_json(path, {"tabs": tabs, "current": current}, "session")
@@ -0,0 +1,172 @@
+import json
+import os
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QUrl, pyqtSignal
+from PyQt5.QtWebEngineWidgets import QWebEnginePage, QWebEngineSettings
+
+SITE_SETTINGS_FILE = "site_settings.json"
+
+# Site setting -> (page attribute, value of the attribute when the setting is on)
+ATTRIBUTES = {
+    "images": (QWebEngineSettings.AutoLoadImages, True),
+    "javascript": (QWebEngineSettings.JavascriptEnabled, True),
+    "plugins": (QWebEngineSettings.PluginsEnabled, True),
+    "autoplay": (QWebEngineSettings.PlaybackRequiresUserGesture, False),
+    "webgl": (QWebEngineSettings.WebGLEnabled, True),
+    "canvas_acceleration": (QWebEngineSettings.Accelerated2dCanvasEnabled, True),
+}
+# Not a page attribute: low-priority tabs are frozen as soon as they are
+# hidden and discarded before any other tab
+LOW_PRIORITY = "low_priority"
+SETTING_NAMES = list(ATTRIBUTES) + [LOW_PRIORITY]
+
+# Shown in the site settings dialog
+SETTING_LABELS = {
+    "images": "Load images",
+    "javascript": "JavaScript",
+    "plugins": "Plugins",
+    "autoplay": "Autoplay media",
+    "webgl": "WebGL",
+    "canvas_acceleration": "Accelerated 2D canvas",
+    LOW_PRIORITY: "Low priority (freeze as soon as hidden)",
+}
+
+DEFAULTS = {name: True for name in ATTRIBUTES}
+DEFAULTS[LOW_PRIORITY] = False
+# What lite mode changes everywhere, unless a site says otherwise;
+# JavaScript stays on since most sites are unusable without it
+LITE_MODE = {"images": False, "plugins": False, "autoplay": False, "webgl": False,
+             "canvas_acceleration": False, LOW_PRIORITY: True}
+
+# Hosts whose resolved settings are remembered
+CACHE_SIZE = 512
+
+
+def normalize_pattern(pattern):
+    # "example.com", "*.example.com" and ".example.com" all mean the domain
+    # and every subdomain
+    pattern = pattern.strip().lower()
+    if "://" in pattern:
+        pattern = pattern.split("://", 1)[1]
+    pattern = pattern.split("/", 1)[0].lstrip("*").lstrip(".")
+    if pattern.startswith("www."):
+        pattern = pattern[4:]
+    return pattern
+
+
+class SiteSettings(QObject):
+    """Per-site page settings, with a global lite mode underneath.
+
+    Rules are keyed by domain and apply to the domain and its subdomains;
+    the most specific rule wins per setting. Matching walks the host's
+    parent domains through a dict, so a lookup costs one probe per label,
+    and resolved hosts are cached.
+    """
+
+    changed = pyqtSignal()
+
+    def __init__(self, path=SITE_SETTINGS_FILE, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.lite_mode = False
+        self.lite = dict(LITE_MODE)
+        self.rules = {}  # domain -> {setting: bool}
+        self._cache = OrderedDict()
+        self.load()
+
+    def load(self):
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    content = f.read().strip()
+                    data = json.loads(content) if content else {}
+            except (json.JSONDecodeError, IOError):
+                data = {}
+        self.lite_mode = bool(data.get("lite_mode", False))
+        lite = data.get("lite")
+        if isinstance(lite, dict):
+            self.lite = {k: bool(v) for k, v in lite.items() if k in SETTING_NAMES}
+        self.rules = {}
+        for pattern, rule in data.get("sites", {}).items():
+            if isinstance(rule, dict):
+                self.set_rule(pattern, rule, notify=False)
+        self._cache.clear()
+
+    def to_json(self):
+        return {"lite_mode": self.lite_mode, "lite": self.lite, "sites": self.rules}
+
+    def set_lite_mode(self, enabled):
+        self.lite_mode = enabled
+        self._cache.clear()
+        self.changed.emit()
+
+    def rule(self, pattern):
+        return dict(self.rules.get(normalize_pattern(pattern), {}))
+
+    def set_rule(self, pattern, rule, notify=True):
+        # Settings missing from rule fall back to lite mode or the defaults
+        domain = normalize_pattern(pattern)
+        if not domain:
+            return
+        rule = {k: bool(v) for k, v in rule.items() if k in SETTING_NAMES}
+        if rule:
+            self.rules[domain] = rule
+        else:
+            self.rules.pop(domain, None)
+        self._cache.clear()
+        if notify:
+            self.changed.emit()
+
+    def for_host(self, host):
+        # Effective {setting: bool} for a host
+        host = (host or "").lower().rstrip(".")
+        settings = self._cache.get(host)
+        if settings is not None:
+            self._cache.move_to_end(host)
+            return settings
+        settings = dict(DEFAULTS)
+        if self.lite_mode:
+            settings.update(self.lite)
+        # Parent domains first, so the most specific rule is applied last
+        labels = host.split(".")
+        for i in range(len(labels) - 1, -1, -1):
+            rule = self.rules.get(".".join(labels[i:]))
+            if rule:
+                settings.update(rule)
+        self._cache[host] = settings
+        if len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return settings
+
+    def apply(self, page, url):
+        # Returns True if any page attribute changed
+        settings = self.for_host(url.host())
+        page.low_priority = settings[LOW_PRIORITY]
+        web_settings = page.settings()
+        changed = False
+        for name, (attribute, on_value) in ATTRIBUTES.items():
+            value = on_value if settings[name] else not on_value
+            if web_settings.testAttribute(attribute) != value:
+                web_settings.setAttribute(attribute, value)
+                changed = True
+        return changed
+
+
+class SitePage(QWebEnginePage):
+    """A page that switches to the target site's settings before each main-frame navigation."""
+
+    # Emitted before each main-frame navigation, while the page can still be
+    # set up for the new document
+    navigation_starting = pyqtSignal(QUrl)
+
+    def __init__(self, profile, site_settings, parent=None):
+        super().__init__(profile, parent)
+        self.site_settings = site_settings
+        self.low_priority = False
+
+    def acceptNavigationRequest(self, url, nav_type, is_main_frame):
+        if is_main_frame:
+            self.site_settings.apply(self, url)
+            self.navigation_starting.emit(url)
+        return super().acceptNavigationRequest(url, nav_type, is_main_frame)
@@ -0,0 +1,76 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class StartupTrace:
+    """Records how long each startup step took, relative to the first import.
+
+    Steps are always recorded, since the imports run before the command line
+    is parsed, but the trace is only written out when enable() was called.
+    Recording stops once finish() marks the end of startup, or later if
+    marks passed to expect() have not been seen yet.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.enabled = False
+        self.path = None
+        self.spans = []
+        self.marks = {}
+        self.finished = False
+        # Marks finish() waits for
+        self.pending = set()
+        self._finish_requested = False
+
+    def enable(self, path):
+        self.enabled = True
+        self.path = path
+
+    def _ms(self, when):
+        return round((when - self.origin) * 1000, 3)
+
+    def record(self, name, start, end):
+        if not self.finished:
+            self.spans.append({"name": name, "start_ms": self._ms(start), "duration_ms": round((end - start) * 1000, 3)})
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def mark(self, name):
+        # Only the first occurrence of a mark is kept
+        if self.finished:
+            return
+        if name not in self.marks:
+            self.marks[name] = self._ms(time.perf_counter())
+        self.pending.discard(name)
+        if self._finish_requested and not self.pending:
+            self.finish()
+
+    def expect(self, name):
+        # finish() waits for this mark unless forced
+        if not self.finished and name not in self.marks:
+            self.pending.add(name)
+
+    def finish(self, force=False):
+        if self.finished:
+            return
+        if not self._finish_requested:
+            self._finish_requested = True
+            self.marks["startup_finished"] = self._ms(time.perf_counter())
+        if self.pending and not force:
+            return
+        self.finished = True
+        if not self.enabled:
+            return
+        with open(self.path, 'w') as f:
+            json.dump({"spans": self.spans, "marks": self.marks}, f, indent=2)
+
+
+# Shared by every module that reports startup work
+trace = StartupTrace()
@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtWebEngineWidgets import QWebEnginePage
+
+# Defaults, overridable in settings.json
+FREEZE_AFTER_S = 300
+MAX_LIVE_TABS = 8
+MEMORY_BUDGET_MB = 0  # 0 disables the memory budget
+CHECK_INTERVAL_MS = 30000
+
+STATE_NAMES = {
+    QWebEnginePage.LifecycleState.Active: "active",
+    QWebEnginePage.LifecycleState.Frozen: "frozen",
+    QWebEnginePage.LifecycleState.Discarded: "discarded",
+}
+
+
+def process_memory(pid):
+    # Resident set size of a process in bytes, or 0 where /proc isn't available
+    if not pid:
+        return 0
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return 0
+
+
+class TabLifecycleManager(QObject):
+    """Moves background tabs from Active to Frozen to Discarded.
+
+    Tabs are kept in least-recently-used order. A background tab is frozen
+    once it has been hidden for freeze_after seconds, and the least recently
+    used tabs are discarded whenever more than max_live_tabs renderers are
+    alive or their memory exceeds the budget. Pages marked low_priority
+    (see site_settings) are frozen as soon as they are hidden and discarded
+    first. Discarded pages reload by themselves when they are made Active
+    again on selection.
+    """
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.freeze_after = float(settings.get("tab_freeze_after_s", FREEZE_AFTER_S))
+        self.max_live_tabs = int(settings.get("max_live_tabs", MAX_LIVE_TABS))
+        self.memory_budget = int(settings.get("tab_memory_budget_mb", MEMORY_BUDGET_MB)) * 1024 * 1024
+        self.reclaimed_bytes = 0
+        self.discard_count = 0
+        self._tabs = OrderedDict()  # view -> time it was last visible, oldest first
+        self._current = None
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(CHECK_INTERVAL_MS)
+        self._timer.timeout.connect(self.enforce)
+        self._timer.start()
+
+    def track(self, view):
+        self._tabs[view] = time.monotonic()
+
+    def untrack(self, view):
+        self._tabs.pop(view, None)
+        if self._current is view:
+            self._current = None
+
+    def activate(self, view):
+        # Called when a tab becomes the visible one
+        if view not in self._tabs:
+            return
+        if self._current is not None and self._current in self._tabs:
+            self._tabs[self._current] = time.monotonic()
+        self._current = view
+        self._tabs.move_to_end(view)
+        self._tabs[view] = time.monotonic()
+        page = view.page()
+        if page.lifecycleState() != QWebEnginePage.LifecycleState.Active:
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Active)
+        self.enforce()
+
+    def _is_protected(self, view):
+        page = view.page()
+        return view is self._current or page.isVisible() or page.recentlyAudible()
+
+    def enforce(self):
+        now = time.monotonic()
+        live = []
+        for view, last_seen in self._tabs.items():
+            page = view.page()
+            state = page.lifecycleState()
+            if state == QWebEnginePage.LifecycleState.Discarded:
+                continue
+            live.append(view)
+            freeze_after = 0 if getattr(page, "low_priority", False) else self.freeze_after
+            if (state == QWebEnginePage.LifecycleState.Active
+                    and now - last_seen >= freeze_after
+                    and not self._is_protected(view)):
+                page.setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+
+        # live is in LRU order, so discard from the front, low-priority pages first
+        live.sort(key=lambda view: not getattr(view.page(), "low_priority", False))
+        memory = self.live_memory() if self.memory_budget else 0
+        for view in live:
+            over_count = len(live) > self.max_live_tabs
+            over_memory = self.memory_budget and memory > self.memory_budget
+            if not (over_count or over_memory):
+                break
+            if self._is_protected(view):
+                continue
+            freed = self.discard(view)
+            live = [v for v in live if v is not view]
+            memory -= freed
+
+    def discard(self, view):
+        page = view.page()
+        # Renderer processes can be shared between tabs, so this is an upper bound
+        freed = process_memory(page.renderProcessPid())
+        if page.lifecycleState() == QWebEnginePage.LifecycleState.Active:
+            page.setLifecycleState(QWebEnginePage.LifecycleState.Frozen)
+        page.setLifecycleState(QWebEnginePage.LifecycleState.Discarded)
+        self.reclaimed_bytes += freed
+        self.discard_count += 1
+        return freed
+
+    def live_memory(self):
+        pids = set()
+        for view in self._tabs:
+            page = view.page()
+            if page.lifecycleState() != QWebEnginePage.LifecycleState.Discarded:
+                pids.add(page.renderProcessPid())
+        return sum(process_memory(pid) for pid in pids)
+
+    def stats(self):
+        counts = {name: 0 for name in STATE_NAMES.values()}
+        for view in self._tabs:
+            counts[STATE_NAMES[view.page().lifecycleState()]] += 1
+        counts["discards"] = self.discard_count
+        counts["reclaimed_bytes"] = self.reclaimed_bytes
+        counts["live_bytes"] = self.live_memory()
+        return counts
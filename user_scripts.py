@@ -0,0 +1,217 @@
+import json
+from collections import OrderedDict
+from PyQt5.QtCore import QObject
+from PyQt5.QtWebEngineWidgets import QWebEngineScript
+
+DARK_MODE_SCRIPT_NAME = "gkm-dark-mode"
+COSMETIC_SCRIPT_NAME = "gkm-cosmetic-filter"
+COSMETIC_SITE_SCRIPT_NAME = "gkm-cosmetic-site"
+# Selectors per CSS rule; an invalid selector only disables its own group
+SELECTOR_GROUP = 100
+# Hosts whose element-hiding scripts are remembered
+SITE_CACHE_SIZE = 256
+
+# A plain stylesheet rather than a full-page filter: the page is recoloured
+# once and scrolling costs no extra compositing
+DARK_CSS = """
+:root { color-scheme: dark !important; }
+html, body { background-color: #121212 !important; color: #e0e0e0 !important; }
+body :not(img):not(video):not(picture):not(canvas):not(svg):not(iframe) {
+    background-color: transparent !important; color: inherit !important; border-color: #3a3a3a !important;
+}
+input, textarea, select, button { background-color: #1e1e1e !important; color: #e0e0e0 !important; }
+a, a * { color: #8ab4f8 !important; }
+a:visited, a:visited * { color: #c58af9 !important; }
+"""
+
+# Shared by both scripts: styles are attached to <html> as soon as it exists,
+# which at DocumentCreation is usually not yet the case
+_ATTACH = """
+function attach(style) {
+    var root = document.documentElement;
+    if (root) {
+        if (style.parentNode !== root) root.appendChild(style);
+        return;
+    }
+    new MutationObserver(function(_, observer) {
+        if (document.documentElement) {
+            observer.disconnect();
+            document.documentElement.appendChild(style);
+        }
+    }).observe(document, {childList: true});
+}
+function parentDomains(host) {
+    var domains = [];
+    while (host) {
+        domains.push(host);
+        var dot = host.indexOf('.');
+        host = dot < 0 ? '' : host.slice(dot + 1);
+    }
+    return domains;
+}
+"""
+
+_DARK_MODE_JS = """
+(function() {
+    var css = %s;
+    var state = %s;
+    %s
+    function apply() {
+        var domains = parentDomains(location.hostname);
+        var excluded = domains.some(function(d) { return state.exclusions.indexOf(d) >= 0; });
+        var style = document.getElementById('gkm-dark-mode');
+        if (!state.enabled || excluded) {
+            if (style) style.remove();
+            return;
+        }
+        if (!style) {
+            style = document.createElement('style');
+            style.id = 'gkm-dark-mode';
+        }
+        var siteCss = '';
+        domains.forEach(function(d) { if (state.site_css[d]) siteCss += state.site_css[d]; });
+        style.textContent = css + siteCss;
+        attach(style);
+    }
+    // Lets the browser restyle already open pages without reloading them
+    window.__gkmDarkMode = function(newState) {
+        state = newState;
+        apply();
+    };
+    apply();
+})();
+"""
+
+# Installs (or replaces) one element-hiding stylesheet; the CSS is built
+# in Python, so documents only parse the rules they need
+_COSMETIC_JS = """
+(function() {
+    var css = %s;
+    %s
+    var style = document.getElementById(%s);
+    if (!style) {
+        style = document.createElement('style');
+        style.id = %s;
+    }
+    style.textContent = css;
+    attach(style);
+})();
+"""
+
+COSMETIC_REMOVE_JS = "var s = document.getElementById('gkm-cosmetic-filter'); if (s) s.remove();"
+SITE_REMOVE_JS = "var s = document.getElementById('gkm-cosmetic-site'); if (s) s.remove();"
+
+
+def _hiding_css(selectors):
+    return "\n".join(", ".join(selectors[i:i + SELECTOR_GROUP]) + " { display: none !important; }"
+                      for i in range(0, len(selectors), SELECTOR_GROUP))
+
+
+def _cosmetic_js(style_id, selectors):
+    return _COSMETIC_JS % (json.dumps(_hiding_css(selectors)), _ATTACH, json.dumps(style_id), json.dumps(style_id))
+
+
+def _script(name, source, sub_frames=True):
+    script = QWebEngineScript()
+    script.setName(name)
+    script.setSourceCode(source)
+    script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+    # Isolated from page scripts, but sharing the same DOM
+    script.setWorldId(QWebEngineScript.ApplicationWorld)
+    script.setRunsOnSubFrames(sub_frames)
+    return script
+
+
+class UserScriptManager(QObject):
+    """Keeps the dark mode and cosmetic filter scripts registered on every profile.
+
+    The scripts run at DocumentCreation, before the page paints, so new
+    documents never flash white or show hidden ads. Changing a setting
+    replaces the registered script for future documents; the *_update_js
+    helpers return the code that brings already open pages in line.
+
+    Only generic element hiding is registered on the profiles. Selectors
+    for a particular site go into a script on the page itself, replaced by
+    apply_site_filter as each main-frame navigation starts.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.profiles = []
+        self.dark_state = {"enabled": False, "exclusions": [], "site_css": {}}
+        self.cosmetic_source = None
+        self.cosmetic_engine = None
+        # Generic selectors some site excepts, which can't go in the global stylesheet
+        self._conditional = []
+        self._site_cache = OrderedDict()
+
+    def install(self, profile):
+        self.profiles.append(profile)
+        self._apply(profile)
+
+    def _apply(self, profile):
+        scripts = profile.scripts()
+        for name in (DARK_MODE_SCRIPT_NAME, COSMETIC_SCRIPT_NAME):
+            for script in scripts.findScripts(name):
+                scripts.remove(script)
+        scripts.insert(_script(DARK_MODE_SCRIPT_NAME, _DARK_MODE_JS % (
+            json.dumps(DARK_CSS), json.dumps(self.dark_state), _ATTACH)))
+        if self.cosmetic_source:
+            scripts.insert(_script(COSMETIC_SCRIPT_NAME, self.cosmetic_source))
+
+    def _apply_all(self):
+        for profile in self.profiles:
+            self._apply(profile)
+
+    def set_dark_mode(self, enabled, exclusions=(), site_css=None):
+        self.dark_state = {"enabled": enabled, "exclusions": list(exclusions), "site_css": dict(site_css or {})}
+        self._apply_all()
+
+    def dark_mode_update_js(self):
+        return f"window.__gkmDarkMode && window.__gkmDarkMode({json.dumps(self.dark_state)});"
+
+    def set_cosmetic_filter(self, engine):
+        # engine is an adblock.FilterEngine, or None to stop hiding elements
+        self.cosmetic_engine = engine
+        self._site_cache.clear()
+        if engine is None:
+            self.cosmetic_source = None
+            self._conditional = []
+        else:
+            excepted = set().union(*engine.selector_exceptions.values())
+            self._conditional = [s for s in engine.generic_selectors if s in excepted]
+            self.cosmetic_source = _cosmetic_js(COSMETIC_SCRIPT_NAME,
+                                                [s for s in engine.generic_selectors if s not in excepted])
+        self._apply_all()
+
+    def site_filter_js(self, host):
+        # Element hiding for one site, or None if the generic rules cover it
+        host = (host or "").lower()
+        if host in self._site_cache:
+            self._site_cache.move_to_end(host)
+            return self._site_cache[host]
+        source = None
+        if self.cosmetic_engine is not None:
+            selectors = self.cosmetic_engine.cosmetic_selectors(host, self._conditional)
+            if selectors:
+                source = _cosmetic_js(COSMETIC_SITE_SCRIPT_NAME, selectors)
+        self._site_cache[host] = source
+        if len(self._site_cache) > SITE_CACHE_SIZE:
+            self._site_cache.popitem(last=False)
+        return source
+
+    def apply_site_filter(self, page, url):
+        # Called as a main-frame navigation starts, so the target site's
+        # selectors are in place when its document is created
+        scripts = page.scripts()
+        for script in scripts.findScripts(COSMETIC_SITE_SCRIPT_NAME):
+            scripts.remove(script)
+        source = self.site_filter_js(url.host())
+        if source:
+            scripts.insert(_script(COSMETIC_SITE_SCRIPT_NAME, source, sub_frames=False))
+
+    def cosmetic_update_js(self, host):
+        # Brings an open page on host in line with the current filter
+        if self.cosmetic_source is None:
+            return COSMETIC_REMOVE_JS + SITE_REMOVE_JS
+        return self.cosmetic_source + (self.site_filter_js(host) or SITE_REMOVE_JS)